@@ -0,0 +1,2 @@
+# test.py and test_parallel.py are manual scripts that call the real API
+collect_ignore = ["test.py", "test_parallel.py"]
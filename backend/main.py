@@ -1,22 +1,45 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from routes.resources import router as resources_router
 from routes.images import router as images_router
 from routes.monthly_planner import router as monthly_planner_router
 from routes.strategist import router as strategist_router
 from routes.weekly_planner import router as weekly_planner_router
 from routes.core_planner import router as core_planner_router
+from services.image_jobs import get_image_job_service
+from services.image_variants import get_image_variant_service
+from services.resource_index import get_resource_index
+from utils.resources import get_resource_catalog
+from utils.static_files import CachedStaticFiles
+from utils.workers import shutdown_process_pool
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start background image job workers (re-queues jobs interrupted by a restart)
+    job_service = get_image_job_service()
+    await job_service.start()
+    # Scan resources_content once up front; later requests are served from memory
+    await asyncio.to_thread(get_resource_catalog().refresh)
+    # Index resource metadata (sizes, hashes, colors) in the background
+    resource_index = get_resource_index()
+    await resource_index.start()
+    yield
+    await resource_index.stop()
+    await job_service.stop()
+    shutdown_process_pool()
+
 app = FastAPI(
     title="Creatia API",
     description="API for the Creatia application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -33,8 +56,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for serving generated images
-app.mount("/static", StaticFiles(directory="images_generated"), name="static")
+# Mount static files for serving generated images and resources
+# (immutable caching for content-unique names, strong ETags elsewhere,
+# AVIF/WebP/JPEG negotiated from the Accept header)
+image_variants = get_image_variant_service()
+app.mount("/static", CachedStaticFiles(directory="images_generated", variants=image_variants), name="static")
+app.mount("/resources_content", CachedStaticFiles(directory="resources_content", variants=image_variants), name="resources_content")
 
 # Include routers
 app.include_router(resources_router)
@@ -1,12 +1,23 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from services.image_generator import get_image_generator_service
 from services.prompt_generator import get_aiweekend_prompt, get_prompt_edit
-from typing import Optional, List, Dict, Any
+from services.upstream_scheduler import get_image_scheduler
+from services.generation_cache import get_generation_cache
+from services.image_jobs import JobProgress, get_image_job_service
+from services.image_previews import get_image_preview_broker, validate_preview_key
+from services.derivatives import get_derivative_service, public_url
+from services.image_variants import get_image_variant_service
+from services.reference_normalizer import get_reference_normalizer
+from utils.resources import get_resource_catalog
+from utils.streaming import format_event, stream_events
+from typing import Optional, List, Dict, Any, Awaitable, Callable
+import asyncio
 import tempfile
 import os
 import json
-from pathlib import Path
+import uuid
 
 router = APIRouter(prefix="/images", tags=["images"])
 
@@ -19,6 +30,10 @@ class BatchImageRequest(BaseModel):
     save_directory: Optional[str] = "images_generated/parallel_test"
     filename_prefix: Optional[str] = "aitest_codigo"
     images_url_list: Optional[List[str]] = None
+    batch_mode: str = "n"  # "n" (several images per upstream call) or "fanout"
+    cache: Optional[str] = None  # "reuse" or "refresh"; no caching when omitted
+    partial_images: int = 0  # 1-3 streams progressive previews of every image
+    preview_key: Optional[str] = None  # prefix of the preview ids; generated if omitted
 
 class DailyImageOutput(BaseModel):
     prompt: str
@@ -31,6 +46,11 @@ class WeeklyPlanRequest(BaseModel):
     size: str = "1024x1024"
     output_format: str = "jpeg"
     images_per_day: int = 3
+    batch_mode: str = "n"  # "n" (several images per upstream call) or "fanout"
+    cache: Optional[str] = None  # "reuse" or "refresh"; no caching when omitted
+    partial_images: int = 0  # 1-3 streams progressive previews of every image
+    preview_key: Optional[str] = None  # prefix of the preview ids; generated if omitted
+    max_concurrent_days: Optional[int] = Field(None, ge=1)  # None processes every day at once
 
 
 
@@ -52,36 +72,134 @@ async def generate_batch_images(request: BatchImageRequest):
     }
     """
     try:
-        if request.count <= 0:
-            raise HTTPException(status_code=400, detail="Count must be greater than 0")
-        
-        if request.count > 10:
-            raise HTTPException(status_code=400, detail="Count cannot exceed 10 images per batch")
-        
-        print(request.images_url_list)
-
-        service = get_image_generator_service()
-        result = await service.generate_multiple_images_parallel(
-            prompt=request.prompt,
-            count=request.count,
-            quality=request.quality,
-            size=request.size,
-            output_format=request.output_format,
-            save_directory=request.save_directory,
-            filename_prefix=request.filename_prefix,
-            images_url_list=request.images_url_list
-        )
-        
-        return {
-            "message": f"Batch generation completed: {result['total_successful']} successful, {result['total_failed']} failed",
-            "results": result
-        }
-        
+        return await batch_image_processing(request)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def ensure_preview_key(request: BaseModel) -> None:
+    """
+    Give requests asking for partial previews a preview key, so their image
+    ids ("<preview_key>.<index>" or "<preview_key>.<day>.<index>") are known
+    before generation starts. Client-supplied keys are validated (ValueError).
+    """
+    if request.preview_key:
+        validate_preview_key(request.preview_key)
+    elif request.partial_images:
+        request.preview_key = uuid.uuid4().hex
+
+def validate_batch_request(request: BatchImageRequest) -> None:
+    """
+    Reject batch requests the service would refuse, before any work starts.
+    """
+    if request.count <= 0:
+        raise ValueError("Count must be greater than 0")
+
+    max_batch_size = get_image_scheduler().max_batch_size
+    if request.count > max_batch_size:
+        raise ValueError(f"Count cannot exceed {max_batch_size} images per batch")
+
+async def batch_image_processing(
+    request: BatchImageRequest,
+    on_result: Optional[Callable[[dict], Awaitable[None]]] = None,
+    completed: Optional[Dict[int, dict]] = None,
+) -> dict:
+    """
+    Generate the images of a batch request.
+
+    Args:
+        request: BatchImageRequest with the prompt and generation settings
+        on_result: Optional coroutine receiving each image result as it completes
+        completed: Images already saved by an interrupted job run, by index (not regenerated)
+
+    Returns:
+        dict: Summary message and the per-image results
+    """
+    validate_batch_request(request)
+    ensure_preview_key(request)
+
+    print(request.images_url_list)
+
+    service = get_image_generator_service()
+    result = await service.generate_multiple_images_parallel(
+        prompt=request.prompt,
+        count=request.count,
+        quality=request.quality,
+        size=request.size,
+        output_format=request.output_format,
+        save_directory=request.save_directory,
+        filename_prefix=request.filename_prefix,
+        images_url_list=request.images_url_list,
+        batch_mode=request.batch_mode,
+        cache=request.cache,
+        on_result=on_result,
+        partial_images=request.partial_images,
+        preview_key=request.preview_key,
+        completed=completed
+    )
+
+    return {
+        "message": f"Batch generation completed: {result['total_successful']} successful, {result['total_failed']} failed",
+        "results": result
+    }
+
+@router.post("/generate-batch/stream")
+async def generate_batch_images_stream(request: BatchImageRequest, format: str = "ndjson"):
+    """
+    Same as /generate-batch, but streams one "image" event per image as soon
+    as it is saved (index, image_path, status, error, elapsed_seconds) and a
+    final "summary" event with the usual response body.
+
+    Query params:
+        format: "ndjson" (default) or "sse"
+    """
+    try:
+        validate_batch_request(request)
+        ensure_preview_key(request)
+
+        async def run(on_event):
+            if request.preview_key:
+                await on_event({"event": "previews", "preview_key": request.preview_key})
+            return await batch_image_processing(
+                request,
+                on_result=lambda image_result: on_event({"event": "image", **image_result})
+            )
+
+        return stream_events(run, stream_format=format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    """
+    Queue depth, in-flight calls and throttling counters of the shared
+    gpt-image-1 scheduler.
+    """
+    return get_image_scheduler().get_stats()
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    Size and hit/miss counters of the generated-image cache.
+    """
+    return get_generation_cache().get_stats()
+
+@router.get("/variants")
+async def get_variant_stats():
+    """
+    Size and hit/miss counters of the Accept-negotiated image variant cache.
+    """
+    return get_image_variant_service().get_stats()
+
+@router.get("/references")
+async def get_reference_stats():
+    """
+    Hit/miss counters of the normalized reference cache and the bytes it
+    saved on edit-call uploads.
+    """
+    return await asyncio.to_thread(get_reference_normalizer().get_stats)
+
 @router.post("/generate-weekly-plan")
 async def generate_weekly_plan(request: WeeklyPlanRequest):
     """
@@ -103,6 +221,11 @@ async def generate_weekly_plan(request: WeeklyPlanRequest):
         "images_per_day": 3
     }
     """
+    try:
+        ensure_preview_key(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         result = await weekly_prompt_processing(request)
         # Return the dictionary directly (no Pydantic serialization needed)
@@ -110,12 +233,68 @@ async def generate_weekly_plan(request: WeeklyPlanRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing weekly plan: {str(e)}")
 
-async def weekly_prompt_processing(request: WeeklyPlanRequest) -> dict:
+@router.post("/generate-weekly-plan/stream")
+async def generate_weekly_plan_stream(request: WeeklyPlanRequest, format: str = "ndjson"):
+    """
+    Same as /generate-weekly-plan, but streams day_started / image /
+    day_completed / day_failed events as they happen and a final "summary"
+    event with the usual response body.
+
+    Query params:
+        format: "ndjson" (default) or "sse"
+    """
+    try:
+        ensure_preview_key(request)
+
+        async def run(on_event):
+            if request.preview_key:
+                await on_event({"event": "previews", "preview_key": request.preview_key})
+            return await weekly_prompt_processing(request, on_event=on_event)
+
+        return stream_events(run, stream_format=format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def extract_plan_days(plan_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the {day: {"description", "reference_images"}} entries of a plan.
+
+    Accepts the weekly planner output ({"weekly_plan": {...}}) as well as the
+    monthly plan emitted by the core planner ({"monthly_plan": {"mes": {"semanas": [...]}}}),
+    whose posts are flattened to keys like "semana_1_lunes".
+    """
+    if plan_data.get("weekly_plan"):
+        return plan_data["weekly_plan"]
+
+    monthly_plan = plan_data.get("monthly_plan") or {}
+    month = monthly_plan.get("mes", monthly_plan)
+    days = {}
+    for week_number, week in enumerate(month.get("semanas", []), start=1):
+        for post in week.get("posts", []):
+            if post.get("is_image_required") is False:
+                continue
+            days[f"semana_{week_number}_{post.get('dia')}"] = {
+                "description": post.get("image_detail_description") or post.get("content_description", ""),
+                "reference_images": post.get("reference_images", [])
+            }
+    return days
+
+async def weekly_prompt_processing(
+    request: WeeklyPlanRequest,
+    on_event: Optional[Callable[[dict], Awaitable[None]]] = None,
+    completed: Optional[Dict[str, Dict[int, dict]]] = None,
+) -> dict:
     """
-    Process the weekly planning JSON and generate batch images for each day
+    Process the weekly planning JSON and generate batch images for each day.
+    All days are processed concurrently; upstream calls are bounded by the
+    shared image scheduler and, optionally, by request.max_concurrent_days.
     
     Args:
         request: WeeklyPlanRequest containing the weekly plan data and generation settings
+        on_event: Optional coroutine receiving day_started / image / day_completed /
+            day_failed events as the plan is processed
+        completed: Images already saved by an interrupted job run, by day and index
+            (not regenerated)
         
     Returns:
         dict: Dictionary with results for each day
@@ -128,63 +307,75 @@ async def weekly_prompt_processing(request: WeeklyPlanRequest) -> dict:
     if not weekly_plan_data.get("success", False):
         raise ValueError("Weekly plan data indicates failure")
     
-    weekly_plan = weekly_plan_data.get("weekly_plan", {})
+    weekly_plan = extract_plan_days(weekly_plan_data)
     
     if not weekly_plan:
         raise ValueError("No weekly plan data found")
-    
-    results = {}
-    total_images_generated = 0
-    errors = []
-    
-    # Process each day in the weekly plan
-    for day, day_data in weekly_plan.items():
+
+    ensure_preview_key(request)
+
+    async def emit(event: dict) -> None:
+        if on_event:
+            await on_event(event)
+
+    # Resolve every day's reference images against the resource catalog at once
+    references = await asyncio.to_thread(
+        get_resource_catalog().validate,
+        [ref_image for day_data in weekly_plan.values() for ref_image in day_data.get("reference_images", [])]
+    )
+    for ref_image in references.invalid:
+        suggestions = references.suggestions.get(ref_image)
+        hint = f" (did you mean {', '.join(suggestions)}?)" if suggestions else ""
+        print(f"Warning: Reference image not found: {ref_image}{hint}")
+
+    day_limit = asyncio.Semaphore(request.max_concurrent_days or len(weekly_plan))
+
+    async def process_day(day: str, day_data: Dict[str, Any]) -> tuple:
+        """
+        Returns (day result or None, error messages for the day).
+        """
         try:
-            print(f"Processing {day}...")
-            
             # Get the description (prompt) for the day
             description = day_data.get("description", "")
             if not description:
                 error_msg = f"No description found for {day}"
-                errors.append(error_msg)
-                continue
-            
-            # Get reference images for the day
-            reference_images = day_data.get("reference_images", [])
-            
-            # Convert reference image paths to full paths
-            images_url_list = []
-            if reference_images:
-                for ref_image in reference_images:
-                    # Check if it's a relative path and prepend resources_content/
-                    if not ref_image.startswith("/") and not ref_image.startswith("resources_content/"):
-                        full_path = f"resources_content/{ref_image}"
-                    else:
-                        full_path = ref_image
-                    
-                    # Verify the file exists
-                    if Path(full_path).exists():
+                await emit({"event": "day_failed", "day": day, "error": error_msg})
+                return None, [error_msg]
+
+            async with day_limit:
+                print(f"Processing {day}...")
+                await emit({"event": "day_started", "day": day})
+                
+                # Full paths of the day's reference images (resolved up front)
+                images_url_list = []
+                for ref_image in day_data.get("reference_images", []):
+                    full_path = references.resolved.get(ref_image)
+                    if full_path and full_path not in images_url_list:
                         images_url_list.append(full_path)
-                    else:
-                        print(f"Warning: Reference image not found: {full_path}")
-            
-            # Create day-specific save directory
-            day_save_directory = f"{request.base_save_directory}/{day}"
-            
-            # Generate enhanced prompt using AI Weekend branding
-            enhanced_prompt = get_aiweekend_prompt(description)
-            
-            # Generate batch images for this day
-            batch_result = await service.generate_multiple_images_parallel(
-                prompt=enhanced_prompt,
-                count=request.images_per_day,
-                quality=request.quality,
-                size=request.size,
-                output_format=request.output_format,
-                save_directory=day_save_directory,
-                filename_prefix=f"{day}_aiweekend",
-                images_url_list=images_url_list if images_url_list else None
-            )
+                
+                # Create day-specific save directory
+                day_save_directory = f"{request.base_save_directory}/{day}"
+                
+                # Generate enhanced prompt using AI Weekend branding
+                enhanced_prompt = get_aiweekend_prompt(description)
+                
+                # Generate batch images for this day
+                batch_result = await service.generate_multiple_images_parallel(
+                    prompt=enhanced_prompt,
+                    count=request.images_per_day,
+                    quality=request.quality,
+                    size=request.size,
+                    output_format=request.output_format,
+                    save_directory=day_save_directory,
+                    filename_prefix=f"{day}_aiweekend",
+                    images_url_list=images_url_list if images_url_list else None,
+                    batch_mode=request.batch_mode,
+                    cache=request.cache,
+                    on_result=lambda image_result: emit({"event": "image", "day": day, **image_result}),
+                    partial_images=request.partial_images,
+                    preview_key=f"{request.preview_key}.{day}" if request.preview_key else None,
+                    completed=(completed or {}).get(day)
+                )
             
             # Store results for this day (simplified for serialization)
             generated_image_paths = []
@@ -192,7 +383,7 @@ async def weekly_prompt_processing(request: WeeklyPlanRequest) -> dict:
                 if "image_path" in img_result:
                     generated_image_paths.append(img_result["image_path"])
             
-            results[day] = {
+            day_result = {
                 "original_description": description,
                 "enhanced_prompt": enhanced_prompt,
                 "reference_images": images_url_list,
@@ -202,23 +393,160 @@ async def weekly_prompt_processing(request: WeeklyPlanRequest) -> dict:
                 "failed_results": [{"index": f["index"], "error": f["error"]} for f in batch_result["failed"]]
             }
             
-            total_images_generated += batch_result["total_successful"]
-            
+            day_errors = []
             if batch_result["total_failed"] > 0:
-                errors.append(f"{day}: {batch_result['total_failed']} images failed to generate")
+                day_errors.append(f"{day}: {batch_result['total_failed']} images failed to generate")
             
             print(f"✅ {day}: Generated {batch_result['total_successful']} images")
+            await emit({"event": "day_completed", "day": day, **day_result})
+            return day_result, day_errors
             
         except Exception as e:
             error_msg = f"Error processing {day}: {str(e)}"
-            errors.append(error_msg)
             print(f"❌ {error_msg}")
-            continue
+            await emit({"event": "day_failed", "day": day, "error": error_msg})
+            return None, [error_msg]
+
+    # Submit every day at once; results and errors keep the plan's day order
+    day_outcomes = await asyncio.gather(
+        *[process_day(day, day_data) for day, day_data in weekly_plan.items()]
+    )
+
+    results = {}
+    total_images_generated = 0
+    errors = []
+    for day, (day_result, day_errors) in zip(weekly_plan.keys(), day_outcomes):
+        if day_result is not None:
+            results[day] = day_result
+            total_images_generated += day_result["images_generated"]
+        errors.extend(day_errors)
     
-    return {
+    response = {
         "success": len(results) > 0,
         "results": results,
         "total_days_processed": len(results),
         "total_images_generated": total_images_generated,
         "errors": errors
-    }
\ No newline at end of file
+    }
+    if request.partial_images:
+        response["preview_key"] = request.preview_key
+    return response
+
+
+async def run_batch_job(payload: Dict[str, Any], progress: JobProgress) -> dict:
+    request = BatchImageRequest(**payload)
+    if request.partial_images and not request.preview_key:
+        request.preview_key = progress.job_id
+    await progress.set_total(request.count)
+    return await batch_image_processing(request, on_result=progress, completed=progress.completed_images())
+
+async def run_weekly_plan_job(payload: Dict[str, Any], progress: JobProgress) -> dict:
+    request = WeeklyPlanRequest(**payload)
+    if request.partial_images and not request.preview_key:
+        request.preview_key = progress.job_id
+    weekly_plan = extract_plan_days(request.weekly_plan_json)
+    await progress.set_total(len(weekly_plan) * request.images_per_day)
+    completed = {day: progress.completed_images(day) for day in weekly_plan}
+    return await weekly_prompt_processing(request, on_event=progress, completed=completed)
+
+get_image_job_service().register("generate-batch", run_batch_job)
+get_image_job_service().register("generate-weekly-plan", run_weekly_plan_job)
+
+@router.post("/jobs/generate-batch")
+async def submit_batch_job(request: BatchImageRequest):
+    """
+    Queue a batch generation in the background and return its job id.
+    Poll GET /images/jobs/{job_id} for progress and results.
+    """
+    try:
+        validate_batch_request(request)
+        if request.preview_key:
+            validate_preview_key(request.preview_key)
+        job_id = await get_image_job_service().submit("generate-batch", request.model_dump())
+        return {"job_id": job_id, "status": "queued"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queuing batch job: {str(e)}")
+
+@router.post("/jobs/generate-weekly-plan")
+async def submit_weekly_plan_job(request: WeeklyPlanRequest):
+    """
+    Queue a weekly plan generation in the background and return its job id.
+    Poll GET /images/jobs/{job_id} for per-day/per-image progress and results.
+    """
+    try:
+        if request.preview_key:
+            validate_preview_key(request.preview_key)
+        job_id = await get_image_job_service().submit("generate-weekly-plan", request.model_dump())
+        return {"job_id": job_id, "status": "queued"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queuing weekly plan job: {str(e)}")
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status, progress, partial results and errors of a background image job.
+    """
+    job = await get_image_job_service().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.get("/derivatives")
+async def get_image_derivatives(path: str):
+    """
+    Thumbnail and preview URLs (WebP) for an image under images_generated/
+    or resources_content/. Missing or stale derivatives are built on demand.
+
+    Query params:
+        path: Image path as returned by the generation endpoints
+    """
+    try:
+        service = get_derivative_service()
+        derivatives = await service.ensure(path)
+        return {
+            "path": path,
+            "url": public_url(path),
+            "derivatives": derivatives
+        }
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error building derivatives: {str(e)}")
+
+@router.get("/previews/{image_id}")
+async def get_image_preview(image_id: str):
+    """
+    Partial frames (or the final image) published so far for a streamed image.
+    """
+    preview = get_image_preview_broker().get(image_id)
+    if preview is None:
+        raise HTTPException(status_code=404, detail=f"Preview {image_id} not found")
+    return preview
+
+@router.get("/previews/{image_id}/events")
+async def stream_image_preview(image_id: str):
+    """
+    Server-Sent Events for one streamed image: a "partial" event per
+    low-fidelity frame (replayed for late subscribers), then "completed"
+    with the final image, or "failed". Partial and completed events carry
+    the file's `path` and its public `url`.
+
+    Image ids are "<preview_key>.<index>" for batches and
+    "<preview_key>.<day>.<index>" for weekly plans; jobs use their job id
+    as preview key.
+    """
+    async def events():
+        async for event in get_image_preview_broker().subscribe(image_id):
+            yield format_event(event, "sse")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
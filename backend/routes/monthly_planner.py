@@ -1,8 +1,12 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from services.monthly_planner import get_monthly_planner_service
 from services.weekly_planner import get_weekly_planner_service
+from services.llm_cache import LLMCacheMode
+from services.resource_duplicates import get_duplicate_detector
+from utils.streaming import EventCallback, stream_events
 
 router = APIRouter(prefix="/monthly-planner", tags=["monthly-planner"])
 
@@ -10,6 +14,8 @@ class MonthlyPlanRequest(BaseModel):
     monthly_strategy: str
     brand_context: Optional[str] = None
     month_name: Optional[str] = None
+    # Caché de respuestas del modelo: "reuse", "refresh" o "bypass"
+    cache: LLMCacheMode = "reuse"
 
 class MonthlyPlanResponse(BaseModel):
     success: bool
@@ -21,11 +27,23 @@ class FullMonthlyPlanRequest(BaseModel):
     resources_paths: List[str]
     brand_context: Optional[str] = None
     month_name: Optional[str] = None
+    # Enviar al planner un solo recurso por grupo de imágenes casi duplicadas
+    collapse_duplicates: bool = False
+    # Colores de marca y máximo de recursos preseleccionados por semana
+    brand_colors: Optional[List[str]] = None
+    max_resources: Optional[int] = None
+    # Semanas generadas a la vez y segundos máximos por semana (None usa los valores por defecto)
+    max_concurrent_weeks: Optional[int] = Field(None, ge=1)
+    week_timeout_seconds: Optional[float] = Field(None, gt=0)
+    # Caché de respuestas del modelo: "reuse", "refresh" o "bypass"
+    cache: LLMCacheMode = "reuse"
 
 class FullMonthlyPlanResponse(BaseModel):
     success: bool
     monthly_plan: Optional[Dict[str, Any]] = None
     weekly_social_plans: Optional[Dict[str, Any]] = None
+    # Semanas que fallaron (el resto del mes se devuelve igual)
+    failed_weeks: List[str] = []
     error: Optional[str] = None
 
 @router.post("/generate")
@@ -43,10 +61,11 @@ async def generate_monthly_plan(request: MonthlyPlanRequest) -> MonthlyPlanRespo
         service = get_monthly_planner_service()
         
         # Generar el plan mensual
-        monthly_plan = service.generate_monthly_plan(
+        monthly_plan = await service.generate_monthly_plan_async(
             monthly_strategy=request.monthly_strategy,
             brand_context=request.brand_context,
-            month_name=request.month_name
+            month_name=request.month_name,
+            cache=request.cache
         )
         
         return MonthlyPlanResponse(
@@ -60,10 +79,81 @@ async def generate_monthly_plan(request: MonthlyPlanRequest) -> MonthlyPlanRespo
             error=f"Error al generar el plan mensual: {str(e)}"
         )
 
+async def full_monthly_plan_processing(
+    request: FullMonthlyPlanRequest,
+    on_event: Optional[EventCallback] = None
+) -> Dict[str, Any]:
+    """
+    Plan mensual + planes semanales de las 4 semanas, generados en paralelo.
+    
+    Args:
+        request: Estrategia mensual, recursos y contexto de marca
+        on_event: Corrutina opcional que recibe "monthly_plan" y luego
+            "week_completed" / "week_failed" a medida que termina cada semana
+        
+    Returns:
+        Cuerpo de FullMonthlyPlanResponse
+    """
+    async def emit(event: Dict[str, Any]) -> None:
+        if on_event:
+            await on_event(event)
+    
+    monthly_service = get_monthly_planner_service()
+    weekly_service = get_weekly_planner_service()
+    
+    # Validar recursos una sola vez (en paralelo con el plan mensual)
+    async def prepare_resources() -> List[str]:
+        valid_resources = (await asyncio.to_thread(weekly_service.validate_resources, request.resources_paths)).valid
+        if request.collapse_duplicates:
+            valid_resources = await asyncio.to_thread(get_duplicate_detector().collapse, valid_resources)
+        return valid_resources
+    
+    # Paso 1: Generar plan mensual (4 semanas)
+    print("🗓️  Generando plan mensual...")
+    monthly_plan, valid_resources = await asyncio.gather(
+        monthly_service.generate_monthly_plan_async(
+            monthly_strategy=request.monthly_strategy,
+            brand_context=request.brand_context,
+            month_name=request.month_name,
+            cache=request.cache
+        ),
+        prepare_resources()
+    )
+    await emit({"event": "monthly_plan", "monthly_plan": monthly_plan, "resources": valid_resources})
+    
+    # Paso 2: Generar los planes semanales en paralelo, avisando cada semana al terminar
+    print("📅 Generando planes semanales detallados...")
+    weekly_social_plans = await weekly_service.generate_weekly_plans_async(
+        weeks=monthly_plan,
+        resources_paths=valid_resources,
+        brand_context=request.brand_context,
+        brand_colors=request.brand_colors,
+        max_resources=request.max_resources,
+        max_concurrent_weeks=request.max_concurrent_weeks,
+        week_timeout=request.week_timeout_seconds,
+        on_week=lambda week: emit({"event": "week_failed" if "error" in week else "week_completed", **week}),
+        cache=request.cache
+    )
+    
+    failed_weeks = [week_key for week_key, week in weekly_social_plans.items() if "error" in week]
+    if weekly_social_plans and len(failed_weeks) == len(weekly_social_plans):
+        raise Exception(f"No se pudo generar ninguna semana: {weekly_social_plans[failed_weeks[0]]['error']}")
+    
+    print("✅ Plan mensual completo generado!")
+    
+    return {
+        "success": True,
+        "monthly_plan": monthly_plan,
+        "weekly_social_plans": weekly_social_plans,
+        "failed_weeks": failed_weeks
+    }
+
 @router.post("/generate-full")
 async def generate_full_monthly_plan(request: FullMonthlyPlanRequest) -> FullMonthlyPlanResponse:
     """
     Genera un plan mensual completo: divide en 4 semanas y genera plan semanal detallado para cada una.
+    Las semanas se generan en paralelo; las que fallan aparecen en failed_weeks
+    (con "error") y el resto del mes se devuelve igual.
     
     Args:
         request: Contiene la estrategia mensual, recursos y contexto de marca
@@ -72,52 +162,28 @@ async def generate_full_monthly_plan(request: FullMonthlyPlanRequest) -> FullMon
         Plan mensual y planes semanales detallados con imágenes y descripciones por día
     """
     try:
-        monthly_service = get_monthly_planner_service()
-        weekly_service = get_weekly_planner_service()
-        
-        # Paso 1: Generar plan mensual (4 semanas)
-        print("🗓️  Generando plan mensual...")
-        monthly_plan = monthly_service.generate_monthly_plan(
-            monthly_strategy=request.monthly_strategy,
-            brand_context=request.brand_context,
-            month_name=request.month_name
-        )
-        
-        # Paso 2: Para cada semana, generar plan semanal detallado
-        print("📅 Generando planes semanales detallados...")
-        weekly_social_plans = {}
-        
-        for week_key, week_data in monthly_plan.items():
-            if week_key.startswith("semana_"):
-                print(f"   Procesando {week_key}...")
-                
-                # Validar recursos disponibles
-                valid_resources = weekly_service.validate_resources(request.resources_paths)
-                
-                # Generar plan semanal usando la descripción del monthly planner
-                weekly_plan = weekly_service.generate_weekly_plan(
-                    high_level_planning=week_data["planning_description"],
-                    resources_paths=valid_resources,
-                    brand_context=request.brand_context
-                )
-                
-                # Agregar metadatos de la semana
-                weekly_social_plans[week_key] = {
-                    "week_number": week_data["week_number"],
-                    "planning_description": week_data["planning_description"],
-                    "daily_posts": weekly_plan
-                }
-        
-        print("✅ Plan mensual completo generado!")
-        
-        return FullMonthlyPlanResponse(
-            success=True,
-            monthly_plan=monthly_plan,
-            weekly_social_plans=weekly_social_plans
-        )
+        return FullMonthlyPlanResponse(**await full_monthly_plan_processing(request))
         
     except Exception as e:
         return FullMonthlyPlanResponse(
             success=False,
             error=f"Error al generar el plan mensual completo: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+@router.post("/generate-full/stream")
+async def generate_full_monthly_plan_stream(request: FullMonthlyPlanRequest, format: str = "ndjson"):
+    """
+    Igual que /generate-full, pero emite un evento "monthly_plan" en cuanto
+    está el plan mensual, un "week_completed" / "week_failed" por semana a
+    medida que terminan y un "summary" final con la respuesta habitual.
+    
+    Query params:
+        format: "ndjson" (por defecto) o "sse"
+    """
+    try:
+        return stream_events(
+            lambda on_event: full_monthly_plan_processing(request, on_event=on_event),
+            stream_format=format
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,44 +1,210 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, Field
 from services.resources import get_resources_service
+from services.resource_index import get_resource_index
+from services.resource_duplicates import get_duplicate_detector
+from services.resource_search import get_resource_search
+from services.resource_uploads import UploadError, get_resource_upload_service
 
 router = APIRouter(prefix="/resources", tags=["resources"])
 
+class ListingFilters:
+    """Optional index-backed filters and cursor pagination for listings"""
+
+    def __init__(
+        self,
+        format: Optional[str] = None,
+        min_aspect_ratio: Optional[float] = Query(None, gt=0),
+        max_aspect_ratio: Optional[float] = Query(None, gt=0),
+        limit: Optional[int] = Query(None, ge=1, le=500),
+        cursor: Optional[str] = None,
+    ):
+        self.format = format
+        self.min_aspect_ratio = min_aspect_ratio
+        self.max_aspect_ratio = max_aspect_ratio
+        self.limit = limit
+        self.cursor = cursor
+
+    @property
+    def active(self) -> bool:
+        return any(value is not None for value in vars(self).values())
+
+async def query_index(category: Optional[str], filters: ListingFilters, collapse_duplicates: bool = False) -> dict:
+    try:
+        clusters = None
+        if collapse_duplicates:
+            clusters = (await asyncio.to_thread(get_duplicate_detector().clusters)).ranks(category)
+        return await asyncio.to_thread(
+            get_resource_index().query,
+            category=category,
+            image_format=filters.format,
+            min_aspect_ratio=filters.min_aspect_ratio,
+            max_aspect_ratio=filters.max_aspect_ratio,
+            limit=filters.limit or 50,
+            cursor=filters.cursor,
+            clusters=clusters,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def collapse(paths: List[str], collapse_duplicates: bool) -> List[str]:
+    if not collapse_duplicates:
+        return paths
+    return await asyncio.to_thread(get_duplicate_detector().collapse, paths)
+
+async def list_category(category: str, filters: ListingFilters, collapse_duplicates: bool = False) -> dict:
+    """
+    Plain path listing from the catalog, or a filtered page with metadata
+    from the index when any filter or pagination parameter is given.
+    With `collapse_duplicates` only the most canonical file of each
+    near-duplicate cluster in the category is listed; on paginated
+    listings this happens before pagination, so no two pages share a
+    cluster.
+    """
+    if not filters.active:
+        return {category: await collapse(get_resources_service().get_category(category), collapse_duplicates)}
+    page = await query_index(category, filters, collapse_duplicates)
+    return {category: [item["path"] for item in page["items"]], **page}
+
 @router.get("/templates")
-async def get_templates():
+async def get_templates(filters: ListingFilters = Depends(ListingFilters), collapse_duplicates: bool = False):
     """Get all available templates"""
     try:
-        service = get_resources_service()
-        templates = service.get_templates()
-        return {"templates": templates}
+        return await list_category("templates", filters, collapse_duplicates)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/elements")
-async def get_elements():
+async def get_elements(filters: ListingFilters = Depends(ListingFilters), collapse_duplicates: bool = False):
     """Get all available elements"""
     try:
-        service = get_resources_service()
-        elements = service.get_elements()
-        return {"elements": elements}
+        return await list_category("elements", filters, collapse_duplicates)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/avatars")
-async def get_avatars():
+async def get_avatars(filters: ListingFilters = Depends(ListingFilters), collapse_duplicates: bool = False):
     """Get all available avatars"""
     try:
-        service = get_resources_service()
-        avatars = service.get_avatars()
-        return {"avatars": avatars}
+        return await list_category("avatars", filters, collapse_duplicates)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/images")
-async def get_images():
+async def get_images(filters: ListingFilters = Depends(ListingFilters), collapse_duplicates: bool = False):
     """Get all available images"""
+    try:
+        return await list_category("images", filters, collapse_duplicates)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/all")
+async def get_all_resources(collapse_duplicates: bool = False):
+    """Get every resource, grouped by category"""
     try:
         service = get_resources_service()
-        images = service.get_images()
-        return {"images": images}
+        resources = service.get_all_resources()
+        if collapse_duplicates:
+            # Per category, so a file used in two of them stays listed in both
+            resources = {category: await collapse(paths, True) for category, paths in resources.items()}
+        return {"resources": resources}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/index")
+async def search_resources(category: Optional[str] = None, filters: ListingFilters = Depends(ListingFilters)):
+    """
+    Resource metadata (size, format, hashes, dominant colors) from the
+    index, filtered by category/format/aspect ratio and paginated with
+    `cursor` = the previous page's `next_cursor`
+    """
+    try:
+        return await query_index(category, filters)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/index/stats")
+async def get_index_stats():
+    """Indexed counts per category and background sync status"""
+    return await asyncio.to_thread(get_resource_index().get_stats)
+
+class ResourceSearchRequest(BaseModel):
+    query: Optional[str] = None
+    colors: Optional[List[str]] = None
+    similar_to: Optional[str] = None
+    category: Optional[str] = None
+    k: int = Field(12, ge=1, le=200)
+    candidates: Optional[List[str]] = None
+
+@router.post("/search")
+async def search_similar_resources(request: ResourceSearchRequest):
+    """
+    Top-k resources for a description, brand colors and/or an example
+    resource, scored locally against color histograms, perceptual hashes
+    and keywords
+    """
+    try:
+        results = await asyncio.to_thread(
+            get_resource_search().search,
+            query=request.query,
+            colors=request.colors,
+            category=request.category,
+            k=request.k,
+            candidates=request.candidates,
+            similar_to=request.similar_to,
+        )
+        return {"results": results}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/duplicates")
+async def get_duplicates(threshold: Optional[int] = Query(None, ge=0, le=32)):
+    """
+    Near-duplicate clusters (perceptual hash distance <= threshold bits, or
+    byte-identical files) with the bytes their extra copies take up
+    """
+    try:
+        return await asyncio.to_thread(get_duplicate_detector().report, threshold)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/refresh")
+async def refresh_resources():
+    """Rescan resources_content now instead of waiting for the next mtime check"""
+    try:
+        service = get_resources_service()
+        counts = await asyncio.to_thread(service.refresh)
+        get_resource_index().request_sync()
+        return {"refreshed": True, "counts": counts}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{category}")
+async def upload_resources(category: str, request: Request):
+    """
+    Upload one or more raster images (multipart/form-data, any field name;
+    SVGs are refused) into a category. Files are streamed to disk, and
+    byte-identical duplicates of existing resources are rejected; thumbnails
+    and metadata are built in the background
+    """
+    try:
+        service = get_resource_upload_service()
+        return await service.ingest(category, request.headers.get("content-type", ""), request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
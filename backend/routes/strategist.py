@@ -1,9 +1,13 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Dict, List, Optional, Any
 from services.strategist import get_strategist_service
 from services.monthly_planner import get_monthly_planner_service
 from services.weekly_planner import get_weekly_planner_service
+from services.chat_completions import get_chat_completion_client
+from services.llm_cache import LLMCacheMode
+from services.upstream_scheduler import get_chat_scheduler
 
 # Crear el router
 router = APIRouter(prefix="/strategist", tags=["strategist"])
@@ -12,6 +16,8 @@ class StrategistRequest(BaseModel):
     company_info: str
     campaign_focus: Optional[str] = None
     month_name: Optional[str] = None
+    # Caché de respuestas del modelo: "reuse", "refresh" o "bypass"
+    cache: LLMCacheMode = "reuse"
 
 class StrategistResponse(BaseModel):
     monthly_strategy: str
@@ -22,18 +28,26 @@ class FullStrategistRequest(BaseModel):
     campaign_focus: Optional[str] = None
     month_name: Optional[str] = None
     image_resources: List[str] = []
+    # Semanas generadas a la vez y segundos máximos por semana (None usa los valores por defecto)
+    max_concurrent_weeks: Optional[int] = Field(None, ge=1)
+    week_timeout_seconds: Optional[float] = Field(None, gt=0)
+    # Caché de respuestas del modelo: "reuse", "refresh" o "bypass"
+    cache: LLMCacheMode = "reuse"
 
 class WeeklyPlanSummary(BaseModel):
     week_number: int
     planning_description: str
     total_days: int
     has_posts: bool
+    error: Optional[str] = None
 
 class FullStrategistResponse(BaseModel):
     monthly_strategy: str
     brand_context: str
     weekly_plans: List[WeeklyPlanSummary]
     complete_monthly_posts: Dict[str, Any]
+    # Semanas que fallaron (el resto del mes se devuelve igual)
+    failed_weeks: List[int] = []
 
 @router.post("/generate", response_model=StrategistResponse)
 async def generate_strategy(request: StrategistRequest):
@@ -47,10 +61,11 @@ async def generate_strategy(request: StrategistRequest):
         strategist_service = get_strategist_service()
         
         # Generar la estrategia mensual
-        result = strategist_service.generate_monthly_strategy(
+        result = await strategist_service.generate_monthly_strategy_async(
             company_info=request.company_info,
             campaign_focus=request.campaign_focus,
-            month_name=request.month_name
+            month_name=request.month_name,
+            cache=request.cache
         )
         
         return StrategistResponse(
@@ -69,62 +84,97 @@ async def generate_full_strategy(request: FullStrategistRequest):
     2. Planificación mensual dividida en 4 semanas (monthly-planner)
     3. Contenido diario para cada semana (weekly-planner)
     
-    Este endpoint ejecuta toda la cadena: strategist → monthly-planner → weekly-planner
+    Este endpoint ejecuta toda la cadena: strategist → monthly-planner → weekly-planner.
+    Las semanas se generan en paralelo; si alguna falla o supera el tiempo
+    máximo, se devuelve el resto del mes y la semana aparece en failed_weeks.
     """
     try:
         # Paso 1: Generar estrategia mensual con strategist
         strategist_service = get_strategist_service()
-        strategy_result = strategist_service.generate_monthly_strategy(
+        strategy_result = await strategist_service.generate_monthly_strategy_async(
             company_info=request.company_info,
             campaign_focus=request.campaign_focus,
-            month_name=request.month_name
+            month_name=request.month_name,
+            cache=request.cache
         )
         
         # Paso 2: Generar plan mensual con monthly-planner
         monthly_planner_service = get_monthly_planner_service()
-        monthly_plan = monthly_planner_service.generate_monthly_plan(
+        monthly_plan = await monthly_planner_service.generate_monthly_plan_async(
             monthly_strategy=strategy_result["monthly_strategy"],
-            brand_context=strategy_result["brand_context"]
+            brand_context=strategy_result["brand_context"],
+            cache=request.cache
         )
         
-        # Paso 3: Generar contenido diario para cada semana con weekly-planner
+        # Paso 3: Generar contenido diario para las 4 semanas en paralelo con weekly-planner
         weekly_planner_service = get_weekly_planner_service()
+        valid_resources = (await asyncio.to_thread(
+            weekly_planner_service.validate_resources, request.image_resources
+        )).valid
+        
+        weeks = await weekly_planner_service.generate_weekly_plans_async(
+            weeks=monthly_plan,
+            resources_paths=valid_resources,
+            brand_context=strategy_result["brand_context"],
+            max_concurrent_weeks=request.max_concurrent_weeks,
+            week_timeout=request.week_timeout_seconds,
+            cache=request.cache
+        )
         
         complete_monthly_posts = {}
         weekly_summaries = []
+        failed_weeks = []
         
-        for week in monthly_plan["weekly_plans"]:
-            week_number = week["week_number"]
-            planning_description = week["planning_description"]
-            
-            # Generar contenido diario para esta semana
-            weekly_result = weekly_planner_service.generate_weekly_plan(
-                weekly_planning_text=planning_description,
-                brand_context=strategy_result["brand_context"],
-                image_resources=request.image_resources
-            )
+        for week_index, week in enumerate(weeks.values(), start=1):
+            week_number = week["week_number"] if isinstance(week["week_number"], int) else week_index
+            daily_posts = week.get("daily_posts") or {}
             
-            # Agregar al resultado completo
-            complete_monthly_posts[f"week_{week_number}"] = weekly_result
+            # Agregar al resultado completo (las semanas fallidas no tienen posts)
+            if "error" in week:
+                failed_weeks.append(week_number)
+            else:
+                complete_monthly_posts[f"week_{week_number}"] = daily_posts
             
             # Crear resumen de la semana
             weekly_summaries.append(WeeklyPlanSummary(
                 week_number=week_number,
-                planning_description=planning_description,
-                total_days=len(weekly_result["weekly_plan"]),
-                has_posts=len(weekly_result["weekly_plan"]) > 0
+                planning_description=week["planning_description"],
+                total_days=len(daily_posts),
+                has_posts=len(daily_posts) > 0,
+                error=week.get("error")
             ))
         
+        if weeks and len(failed_weeks) == len(weeks):
+            raise Exception(f"No se pudo generar ninguna semana: {weekly_summaries[0].error}")
+        
         return FullStrategistResponse(
             monthly_strategy=strategy_result["monthly_strategy"],
             brand_context=strategy_result["brand_context"],
             weekly_plans=weekly_summaries,
-            complete_monthly_posts=complete_monthly_posts
+            complete_monthly_posts=complete_monthly_posts,
+            failed_weeks=failed_weeks
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar estrategia completa: {str(e)}")
 
+@router.get("/scheduler")
+async def get_chat_scheduler_stats():
+    """
+    Cola, llamadas en curso y contadores de throttling del scheduler
+    compartido por strategist, monthly planner y weekly planner.
+    """
+    return get_chat_scheduler().get_stats()
+
+@router.get("/cache")
+async def get_llm_cache_stats():
+    """
+    Tamaño y contadores hit/miss/bypass de la caché de respuestas del modelo,
+    llamadas en curso y peticiones idénticas que se unieron a una en curso
+    (coalesced).
+    """
+    return await asyncio.to_thread(get_chat_completion_client().get_stats)
+
 @router.post("/validate-info")
 async def validate_company_info(request: Dict[str, str]):
     """
@@ -1,7 +1,10 @@
+import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from services.weekly_planner import get_weekly_planner_service
+from services.llm_cache import LLMCacheMode
+from services.resource_duplicates import get_duplicate_detector
 
 router = APIRouter(prefix="/weekly-planner", tags=["weekly-planner"])
 
@@ -9,6 +12,13 @@ class WeeklyPlanRequest(BaseModel):
     high_level_planning: str
     resources_paths: List[str]
     brand_context: Optional[str] = None
+    # Enviar al planner un solo recurso por grupo de imágenes casi duplicadas
+    collapse_duplicates: bool = False
+    # Colores de marca y máximo de recursos preseleccionados para el planner
+    brand_colors: Optional[List[str]] = None
+    max_resources: Optional[int] = None
+    # Caché de respuestas del modelo: "reuse", "refresh" o "bypass"
+    cache: LLMCacheMode = "reuse"
 
 class WeeklyPlanResponse(BaseModel):
     success: bool
@@ -30,19 +40,32 @@ async def generate_weekly_plan(request: WeeklyPlanRequest) -> WeeklyPlanResponse
         service = get_weekly_planner_service()
         
         # Validar recursos antes de generar el plan
-        valid_resources = service.validate_resources(request.resources_paths)
+        valid_resources = (await asyncio.to_thread(service.validate_resources, request.resources_paths)).valid
         
         if not valid_resources:
             return WeeklyPlanResponse(
                 success=False,
                 error="No se encontraron recursos válidos en las rutas proporcionadas"
             )
+
+        if request.collapse_duplicates:
+            valid_resources = await asyncio.to_thread(get_duplicate_detector().collapse, valid_resources)
+
+        # Pasar al planner solo los recursos más afines a la planificación
+        valid_resources = await asyncio.to_thread(
+            service.select_resources,
+            request.high_level_planning,
+            valid_resources,
+            request.brand_colors,
+            request.max_resources
+        )
         
         # Generar el plan semanal
-        weekly_plan = service.generate_weekly_plan(
+        weekly_plan = await service.generate_weekly_plan_async(
             high_level_planning=request.high_level_planning,
             resources_paths=valid_resources,
-            brand_context=request.brand_context
+            brand_context=request.brand_context,
+            cache=request.cache
         )
         
         return WeeklyPlanResponse(
@@ -65,19 +88,21 @@ async def validate_resources(resources_paths: List[str]) -> Dict[str, Any]:
         resources_paths: Lista de paths a validar
         
     Returns:
-        Información sobre recursos válidos e inválidos
+        Recursos válidos (resueltos a su path completo), inválidos y
+        sugerencias de recursos parecidos para cada inválido
     """
     try:
         service = get_weekly_planner_service()
-        valid_resources = service.validate_resources(resources_paths)
-        invalid_resources = [path for path in resources_paths if path not in valid_resources]
+        validation = await asyncio.to_thread(service.validate_resources, resources_paths)
         
         return {
             "success": True,
-            "valid_resources": valid_resources,
-            "invalid_resources": invalid_resources,
-            "total_valid": len(valid_resources),
-            "total_invalid": len(invalid_resources)
+            "valid_resources": validation.valid,
+            "invalid_resources": validation.invalid,
+            "resolved": validation.resolved,
+            "suggestions": validation.suggestions,
+            "total_valid": len(validation.valid),
+            "total_invalid": len(validation.invalid)
         }
         
     except Exception as e:
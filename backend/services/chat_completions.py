@@ -0,0 +1,118 @@
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from services.llm_cache import LLM_CACHE_MODES, LLMResponseCache, get_llm_response_cache
+from services.upstream_scheduler import UpstreamScheduler, get_chat_scheduler
+
+load_dotenv()
+
+
+class ChatCompletionClient:
+    """
+    Shared AsyncOpenAI client for the planning services.
+
+    Calls are coroutines on the event loop, so a long o3/gpt-4o request
+    doesn't block other requests, and they all go through one chat
+    scheduler that bounds concurrency and handles 429s. Responses are
+    served from and stored in the LLM response cache, and identical calls
+    made while one is already in flight wait for that one instead of
+    going upstream again (single flight).
+    """
+
+    def __init__(self, scheduler: UpstreamScheduler, cache: LLMResponseCache):
+        # Retries are owned by the scheduler
+        self.client = AsyncOpenAI(max_retries=0)
+        self.scheduler = scheduler
+        self.cache = cache
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._coalesced = 0
+
+    async def create(self, cache: str = "reuse", **params: Any) -> str:
+        """
+        Run chat.completions.create(**params) and return the message content.
+
+        Concurrent calls with the same parameters and cache mode share one
+        upstream call; its result, or its error, goes to every caller.
+
+        Args:
+            cache: "reuse" (default), "refresh" or "bypass"; see LLM_CACHE_MODES
+            params: Arguments of chat.completions.create
+        """
+        if cache not in LLM_CACHE_MODES:
+            raise ValueError(f"cache must be one of {', '.join(LLM_CACHE_MODES)}")
+
+        flight_key = (self.cache.make_key(params), cache)
+        future = self._in_flight.get(flight_key)
+        if future is not None:
+            self._coalesced += 1
+        else:
+            future = self._in_flight[flight_key] = asyncio.ensure_future(self._fetch(flight_key[0], cache, params))
+
+            def done(future: asyncio.Future) -> None:
+                self._in_flight.pop(flight_key, None)
+                # Mark the error as retrieved even if every caller went away
+                if not future.cancelled():
+                    future.exception()
+
+            future.add_done_callback(done)
+        # Shielded so one caller disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, key: str, cache: str, params: Dict[str, Any]) -> str:
+        if cache == "bypass":
+            self.cache.record_bypass()
+        elif cache == "reuse":
+            content = await self.cache.get_async(key)
+            if content is not None:
+                return content
+
+        response = await self.scheduler.run(lambda: self.client.chat.completions.create(**params))
+        choice = response.choices[0]
+        content = choice.message.content
+        if cache != "bypass" and _is_cacheable(params, choice.finish_reason, content):
+            await self.cache.put_async(key, params.get("model", ""), content)
+        return content
+
+    def get_stats(self) -> dict:
+        """
+        Response cache counters plus the single-flight ones.
+        """
+        return {
+            **self.cache.get_stats(),
+            "in_flight": len(self._in_flight),
+            "coalesced": self._coalesced,
+        }
+
+
+def _is_cacheable(params: dict, finish_reason: Optional[str], content: Optional[str]) -> bool:
+    """
+    Only complete answers are cached (and, for JSON mode, only valid JSON),
+    so a truncated or malformed response is retried next time.
+    """
+    if content is None or finish_reason not in (None, "stop"):
+        return False
+    if (params.get("response_format") or {}).get("type") == "json_object":
+        try:
+            json.loads(content)
+        except ValueError:
+            return False
+    return True
+
+
+_chat_completion_client: Optional[ChatCompletionClient] = None
+
+def get_chat_completion_client() -> ChatCompletionClient:
+    """
+    Process-wide chat client, shared by every planning service instance.
+    """
+    global _chat_completion_client
+    if _chat_completion_client is None:
+        _chat_completion_client = ChatCompletionClient(
+            scheduler=get_chat_scheduler(),
+            cache=get_llm_response_cache(),
+        )
+    return _chat_completion_client
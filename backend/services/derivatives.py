@@ -0,0 +1,204 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from utils.sqlite_store import SQLiteStore
+from utils.workers import run_in_process
+
+load_dotenv()
+
+# Derivative name -> longest side in pixels
+DERIVATIVE_SIZES = {
+    "thumb": 256,
+    "preview": 768,
+}
+
+# Directories whose files may get derivatives
+SOURCE_ROOTS = ("images_generated", "resources_content")
+
+# Directory -> URL prefix it is mounted under in main.py
+STATIC_MOUNTS = {
+    "images_generated": "/static",
+    "resources_content": "/resources_content",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS derivatives (
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    source_size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (source, name)
+);
+"""
+
+
+def build_derivatives(source_path: str, outputs: List[Tuple[str, int, str]]) -> List[Tuple[str, int, int, int]]:
+    """
+    Decode `source_path` once and write a WebP per (name, max_side, path).
+    CPU-bound: runs in the process pool.
+
+    Returns (name, width, height, size_bytes) for each derivative.
+    """
+    built = []
+    with Image.open(source_path) as source:
+        source.load()
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA")
+        for name, max_side, path in outputs:
+            image = source.copy()
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            image.save(tmp_path, format="WEBP", quality=80, method=4)
+            os.replace(tmp_path, path)
+            built.append((name, image.width, image.height, os.path.getsize(path)))
+    return built
+
+
+def public_url(path: str) -> Optional[str]:
+    """
+    URL under which a file in one of the served directories is exposed.
+    """
+    relative = Path(os.path.relpath(os.path.abspath(path)))
+    if not relative.parts or relative.parts[0] not in STATIC_MOUNTS:
+        return None
+    return "/".join([STATIC_MOUNTS[relative.parts[0]], *relative.parts[1:]])
+
+
+class DerivativeService:
+    """
+    Fixed-size WebP thumbnails/previews of generated images and resources.
+
+    Derivatives are built off the event loop, recorded in a SQLite manifest
+    with the source's mtime and size, and rebuilt lazily when missing or
+    stale.
+    """
+
+    def __init__(self, root: str, db_path: str):
+        self.root = Path(root)
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._background = set()
+
+    def resolve_source(self, path: str) -> str:
+        """
+        Normalize `path` and make sure it lives in a served directory.
+        """
+        relative = Path(os.path.relpath(os.path.abspath(path)))
+        if not relative.parts or relative.parts[0] not in SOURCE_ROOTS or ".." in relative.parts:
+            raise ValueError(f"Derivatives are only available for files under {', '.join(SOURCE_ROOTS)}")
+        if relative.parts[0] == "images_generated" and self.root.name in relative.parts:
+            raise ValueError("Derivatives can't be derived again")
+        if not relative.is_file():
+            raise FileNotFoundError(f"Image not found: {path}")
+        return str(relative)
+
+    def _derivative_path(self, source: str, name: str) -> str:
+        # Keep the source suffix so foo.png and foo.webp don't share derivatives
+        relative = Path(source)
+        return str(self.root / relative.parent / f"{relative.name}.{name}.webp")
+
+    def _lookup(self, source: str) -> Optional[Dict[str, Any]]:
+        """
+        Manifest entries for `source`, or None if any is missing or stale.
+        """
+        stat = os.stat(source)
+        rows = self.store.fetchall("SELECT * FROM derivatives WHERE source = ?", (source,))
+        derivatives = {}
+        for row in rows:
+            if (
+                row["source_mtime_ns"] != stat.st_mtime_ns
+                or row["source_size"] != stat.st_size
+                or row["path"] != self._derivative_path(source, row["name"])
+                or not os.path.exists(row["path"])
+            ):
+                return None
+            derivatives[row["name"]] = _describe(row["path"], row["width"], row["height"], row["size_bytes"])
+        if set(derivatives) != set(DERIVATIVE_SIZES):
+            return None
+        return derivatives
+
+    async def _build(self, source: str) -> Dict[str, Any]:
+        stat = os.stat(source)
+        outputs = [(name, size, self._derivative_path(source, name)) for name, size in DERIVATIVE_SIZES.items()]
+        built = await run_in_process(build_derivatives, source, outputs)
+
+        now = time.time()
+        rows = []
+        derivatives = {}
+        for (name, width, height, size_bytes), (_, _, path) in zip(built, outputs):
+            rows.append((source, name, path, width, height, size_bytes, stat.st_mtime_ns, stat.st_size, now))
+            derivatives[name] = _describe(path, width, height, size_bytes)
+        await asyncio.to_thread(
+            self.store.executemany,
+            "INSERT OR REPLACE INTO derivatives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        return derivatives
+
+    async def ensure(self, path: str) -> Dict[str, Any]:
+        """
+        Return the derivatives of `path`, building them first if they are
+        missing or older than the source. Concurrent calls share one build.
+        """
+        source = await asyncio.to_thread(self.resolve_source, path)
+        derivatives = await asyncio.to_thread(self._lookup, source)
+        if derivatives is not None:
+            return derivatives
+
+        future = self._in_flight.get(source)
+        if future is None:
+            future = self._in_flight[source] = asyncio.ensure_future(self._build(source))
+            future.add_done_callback(lambda _: self._in_flight.pop(source, None))
+        return await asyncio.shield(future)
+
+    def schedule(self, path: str) -> None:
+        """
+        Build derivatives in the background without delaying the caller.
+        """
+        task = asyncio.create_task(self.ensure(path))
+        self._background.add(task)
+
+        def done(task: asyncio.Task) -> None:
+            self._background.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                print(f"⚠️  Could not build derivatives for {path}: {task.exception()}")
+
+        task.add_done_callback(done)
+
+
+def _describe(path: str, width: int, height: int, size_bytes: int) -> Dict[str, Any]:
+    return {
+        "url": public_url(path),
+        "path": path,
+        "width": width,
+        "height": height,
+        "size_bytes": size_bytes,
+    }
+
+
+_derivative_service: Optional[DerivativeService] = None
+
+def get_derivative_service() -> DerivativeService:
+    """
+    Process-wide derivative service; files live under IMAGE_DERIVATIVES_DIR
+    and the manifest in IMAGE_DERIVATIVES_DB.
+    """
+    global _derivative_service
+    if _derivative_service is None:
+        _derivative_service = DerivativeService(
+            root=os.getenv("IMAGE_DERIVATIVES_DIR", "images_generated/_derivatives"),
+            db_path=os.getenv("IMAGE_DERIVATIVES_DB", "data/image_derivatives.sqlite3"),
+        )
+    return _derivative_service
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import xxhash
+from dotenv import load_dotenv
+
+from utils.sqlite_store import SQLiteStore
+
+load_dotenv()
+
+CACHE_MODES = ("reuse", "refresh")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+
+class GenerationCache:
+    """
+    Content-addressed store of generated images.
+
+    Each image is keyed by an xxhash of the normalized request that produced
+    it (prompt, reference image contents, generation params and index within
+    the batch), stored once under `root` and tracked in a SQLite manifest
+    with TTL and total-size eviction.
+    """
+
+    def __init__(self, root: str, db_path: str, ttl_seconds: float, max_bytes: int):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def make_key(
+        prompt: str,
+        reference_hashes: List[str],
+        quality: str,
+        size: str,
+        output_format: str,
+        index: int,
+        model: str = "gpt-image-1",
+    ) -> str:
+        normalized = {
+            "model": model,
+            "prompt": " ".join(prompt.split()),
+            "references": reference_hashes,
+            "quality": quality.lower(),
+            "size": size.lower(),
+            "output_format": output_format.lower(),
+            "index": index,
+        }
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return xxhash.xxh3_128_hexdigest(payload.encode("utf-8"))
+
+    def _blob_path(self, key: str, output_format: str) -> Path:
+        return self.root / key[:2] / f"{key}.{output_format.lower()}"
+
+    def lookup(self, key: str, destination: str) -> bool:
+        """
+        Copy the cached image for `key` to `destination`.
+        Returns False on a miss (unknown, expired or missing blob).
+        """
+        row = self.store.fetchone("SELECT path, created_at FROM entries WHERE key = ?", (key,))
+        now = time.time()
+        if row is None or now - row["created_at"] > self.ttl_seconds or not os.path.exists(row["path"]):
+            self._misses += 1
+            return False
+
+        _link_or_copy(row["path"], destination)
+        self.store.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        self._hits += 1
+        return True
+
+    def put(self, key: str, image_path: str, output_format: str) -> None:
+        """
+        Record a freshly generated image under `key`, replacing any previous one.
+        """
+        blob_path = self._blob_path(key, output_format)
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = blob_path.with_suffix(blob_path.suffix + ".tmp")
+        _link_or_copy(image_path, str(tmp_path))
+        os.replace(tmp_path, blob_path)
+
+        now = time.time()
+        self.store.execute(
+            "INSERT OR REPLACE INTO entries (key, path, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, str(blob_path), blob_path.stat().st_size, now, now),
+        )
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop expired entries, then least recently used ones until the store
+        fits in `max_bytes`.
+        """
+        expired = self.store.fetchall(
+            "SELECT key, path FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        self._delete(expired)
+
+        total = self.store.fetchone("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM entries")["total"]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for row in self.store.fetchall("SELECT key, path, size_bytes FROM entries ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append(row)
+            total -= row["size_bytes"]
+        self._delete(victims)
+
+    def _delete(self, rows) -> None:
+        for row in rows:
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+        self.store.executemany("DELETE FROM entries WHERE key = ?", [(row["key"],) for row in rows])
+
+    async def lookup_async(self, key: str, destination: str) -> bool:
+        return await asyncio.to_thread(self.lookup, key, destination)
+
+    async def put_async(self, key: str, image_path: str, output_format: str) -> None:
+        await asyncio.to_thread(self.put, key, image_path, output_format)
+
+    def get_stats(self) -> dict:
+        row = self.store.fetchone("SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS total FROM entries")
+        return {
+            "entries": row["entries"],
+            "total_bytes": row["total"],
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+def _link_or_copy(source: str, destination: str) -> None:
+    """
+    Hard-link when possible (same filesystem, no extra bytes), copy otherwise.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+_generation_cache: Optional[GenerationCache] = None
+
+def get_generation_cache() -> GenerationCache:
+    """
+    Process-wide generation cache, configured through GENERATION_CACHE_DIR,
+    GENERATION_CACHE_DB, GENERATION_CACHE_TTL_HOURS and GENERATION_CACHE_MAX_MB.
+    """
+    global _generation_cache
+    if _generation_cache is None:
+        _generation_cache = GenerationCache(
+            root=os.getenv("GENERATION_CACHE_DIR", "images_generated/_cache"),
+            db_path=os.getenv("GENERATION_CACHE_DB", "data/generation_cache.sqlite3"),
+            ttl_seconds=float(os.getenv("GENERATION_CACHE_TTL_HOURS", "168")) * 3600,
+            max_bytes=int(float(os.getenv("GENERATION_CACHE_MAX_MB", "2048")) * 1024 * 1024),
+        )
+    return _generation_cache
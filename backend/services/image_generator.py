@@ -1,24 +1,65 @@
 import base64
 import os
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
 from PIL import Image
 from io import BytesIO
 from pydantic import BaseModel
 from enum import Enum
-from typing import Optional, Union, List, Any
+from typing import Optional, Union, List, Dict, Any, Awaitable, Callable
 import asyncio
 import concurrent.futures
+import functools
 from pathlib import Path
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
 from services.prompt_generator import get_aiweekend_prompt
-from utils.images_utils import generate_image_path, save_image
+from services.derivatives import get_derivative_service
+from services.generation_cache import CACHE_MODES, get_generation_cache
+from services.image_previews import get_image_preview_broker
+from services.reference_cache import CachedReference, get_reference_image_cache
+from services.reference_normalizer import get_reference_normalizer
+from services.upstream_scheduler import get_image_scheduler
+from utils.images_utils import generate_image_path, save_image, save_image_data_async
+
+# gpt-image-1 accepts between 1 and 10 images per call via `n`
+MAX_IMAGES_PER_CALL = 10
+
+# Thread pool used only when the async client is disabled. Shared so the
+# fallback path doesn't spin up a fresh pool for every image.
+_fallback_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+def _get_fallback_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _fallback_executor
+    if _fallback_executor is None:
+        max_workers = int(os.getenv("IMAGE_FALLBACK_THREADS", "8"))
+        _fallback_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="image-generator"
+        )
+    return _fallback_executor
+
 
 class ImageGeneratorService:
-    def __init__(self):
+    def __init__(self, use_async_client: Optional[bool] = None):
         load_dotenv()
-        self.client = OpenAI()
+        # The thread-pool fallback runs generate_image through the scheduler,
+        # which owns retries; SDK retries would multiply them
+        self.client = OpenAI(max_retries=0)
+
+        # IMAGE_GENERATION_BACKEND=threads forces the thread-pool fallback
+        if use_async_client is None:
+            use_async_client = os.getenv("IMAGE_GENERATION_BACKEND", "async").lower() != "threads"
+        # Retries are owned by the shared scheduler so 429s pause every caller
+        self.async_client = AsyncOpenAI(max_retries=0) if use_async_client else None
+        self.scheduler = get_image_scheduler()
+        self.reference_cache = get_reference_image_cache()
+        self.reference_normalizer = get_reference_normalizer()
+        self.preview_broker = get_image_preview_broker()
+        self.derivatives = get_derivative_service()
+        # Flipped off the first time the API rejects `n`
+        self.n_supported = True
 
     def generate_image(
         self,
@@ -50,7 +91,7 @@ class ImageGeneratorService:
 
         if image_path:
             try:
-                save_image(result, image_path)
+                save_image(result, image_path, output_format)
 
             except Exception as e:
                 print(f"Error saving image: {e}")
@@ -59,49 +100,240 @@ class ImageGeneratorService:
         return result, image_path
 
 
-    async def _generate_image_async(
+    async def generate_image_async(
+        self,
+        prompt: str,
+        quality: str = "medium",
+        size: str = "1024x1024",
+        output_format: str = "jpeg",
+        images_list: Optional[List[Any]] = None,
+        n: int = 1,
+    ):
+        """
+        Generate `n` images with one call on the shared AsyncOpenAI client.
+        The call is a coroutine on the event loop, so in-flight requests
+        don't hold an OS thread and reuse the client's connection pool.
+        """
+        if not images_list:
+            return await self.async_client.images.generate(
+                model="gpt-image-1",
+                prompt=prompt,
+                quality=quality,
+                output_format=output_format,
+                size=size,
+                n=n
+            )
+
+        return await self.async_client.images.edit(
+            model="gpt-image-1",
+            prompt=prompt,
+            quality=quality,
+            output_format=output_format,
+            size=size,
+            image=images_list,
+            n=n
+        )
+
+    async def generate_image_streaming(
         self,
         prompt: str,
         quality: str,
         size: str,
         output_format: str,
+        partial_images: int,
+        on_partial: Callable[[int, str], Awaitable[None]],
         images_list: Optional[List[Any]] = None,
+    ):
+        """
+        Generate one image in streaming mode. `on_partial(partial_index, b64_json)`
+        is awaited for every low-fidelity frame as it arrives.
+        Returns the completed event, which carries `b64_json` like an item of
+        a regular response's `data`.
+        """
+        params = dict(
+            model="gpt-image-1",
+            prompt=prompt,
+            quality=quality,
+            output_format=output_format,
+            size=size,
+            stream=True,
+            partial_images=partial_images
+        )
+        if images_list:
+            stream = await self.async_client.images.edit(image=images_list, **params)
+        else:
+            stream = await self.async_client.images.generate(**params)
+
+        completed = None
+        async for event in stream:
+            if event.type.endswith("partial_image"):
+                await on_partial(event.partial_image_index, event.b64_json)
+            elif event.type.endswith("completed"):
+                completed = event
+
+        if completed is None:
+            raise RuntimeError("Image stream ended without a completed image")
+        return completed
+
+    async def _generate_image_async(
+        self,
+        prompt: str,
+        quality: str,
+        size: str,
+        output_format: str,
+        references: Optional[List[CachedReference]] = None,
         image_index: int = 0,
+        n: int = 1,
     ):
         """
-        Generate a single image asynchronously.
-        This runs the synchronous OpenAI call in a thread pool.
+        Generate a single image asynchronously through the shared scheduler.
+        Uses the AsyncOpenAI client; when it is disabled the synchronous
+        call runs in the shared fallback thread pool instead (always n=1).
+        Every attempt uploads its own views of the cached reference images.
         """
-        loop = asyncio.get_event_loop()
+        def open_images_list() -> Optional[List[Any]]:
+            if not references:
+                return None
+            return [reference.open_view() for reference in references]
 
-        if images_list:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                result = await loop.run_in_executor(
-                    executor,
+        if self.async_client is not None:
+            return await self.scheduler.run(
+                lambda: self.generate_image_async(
+                    prompt=prompt,
+                    quality=quality,
+                    size=size,
+                    output_format=output_format,
+                    images_list=open_images_list(),
+                    n=n
+                ),
+                units=n
+            )
+
+        loop = asyncio.get_running_loop()
+        result, _ = await self.scheduler.run(
+            lambda: loop.run_in_executor(
+                _get_fallback_executor(),
+                functools.partial(
                     self.generate_image,
-                    prompt,
-                    quality,                
-                    size,
-                    output_format,
-                    images_list
+                    prompt=prompt,
+                    quality=quality,
+                    size=size,
+                    output_format=output_format,
+                    images_list=open_images_list()
                 )
+            ),
+            units=1
+        )
 
-            return result
- 
-        # Run the synchronous OpenAI call in a thread pool
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            result = await loop.run_in_executor(
-                executor,
-                self.generate_image,
-                prompt,
-                quality,
-                size,
-                output_format,
-                images_list
-            )
+        return result
+
+    async def _generate_images_fanout(
+        self,
+        prompt: str,
+        indices: List[int],
+        quality: str,
+        size: str,
+        output_format: str,
+        on_image: Callable[[int, Any], Awaitable[None]],
+        references: Optional[List[CachedReference]] = None,
+        partial_images: int = 0,
+        preview_key: Optional[str] = None,
+    ) -> None:
+        """
+        One upstream call per image. `on_image(index, item)` is awaited as
+        soon as each call finishes, with the image data or the exception.
+        With `partial_images`, each image is streamed and its partial frames
+        are published to the preview broker as "<preview_key>.<index>".
+        """
+        async def generate_one(index: int) -> None:
+            try:
+                if partial_images and self.async_client is not None:
+                    preview_id = f"{preview_key}.{index}"
+                    item = await self.scheduler.run(
+                        lambda: self.generate_image_streaming(
+                            prompt=prompt,
+                            quality=quality,
+                            size=size,
+                            output_format=output_format,
+                            partial_images=partial_images,
+                            on_partial=lambda partial_index, image_base64: self.preview_broker.add_partial(
+                                preview_id, partial_index, image_base64, output_format
+                            ),
+                            images_list=[reference.open_view() for reference in references or []]
+                        ),
+                        units=1
+                    )
+                else:
+                    response = await self._generate_image_async(
+                        prompt=prompt,
+                        quality=quality,
+                        size=size,
+                        output_format=output_format,
+                        references=references,
+                        image_index=index,
+                    )
+                    item = response.data[0]
+            except Exception as e:
+                item = e
+            await on_image(index, item)
+
+        await asyncio.gather(*[generate_one(index) for index in indices])
+
+    async def _generate_images_batched(
+        self,
+        prompt: str,
+        indices: List[int],
+        quality: str,
+        size: str,
+        output_format: str,
+        on_image: Callable[[int, Any], Awaitable[None]],
+        references: Optional[List[CachedReference]] = None,
+    ) -> None:
+        """
+        Ask for several images per upstream call via `n`, so the prompt and
+        reference images are sent once per chunk of up to 10 images.
+        Images the API didn't return, or chunks where `n` is rejected, are
+        filled in with one call per image.
+        """
+        chunks = [
+            indices[start:start + MAX_IMAGES_PER_CALL]
+            for start in range(0, len(indices), MAX_IMAGES_PER_CALL)
+        ]
 
-        return result   
-   
+        async def generate_chunk(chunk: List[int]) -> None:
+            try:
+                response = await self._generate_image_async(
+                    prompt=prompt,
+                    quality=quality,
+                    size=size,
+                    output_format=output_format,
+                    references=references,
+                    n=len(chunk)
+                )
+            except Exception as e:
+                if not _is_n_rejected(e):
+                    await asyncio.gather(*[on_image(index, e) for index in chunk])
+                    return
+                print(f"⚠️  `n` rejected by the images API, falling back to one call per image: {e}")
+                self.n_supported = False
+                missing = chunk
+            else:
+                data = list(response.data or [])[:len(chunk)]
+                await asyncio.gather(*[on_image(index, item) for index, item in zip(chunk, data)])
+                missing = chunk[len(data):]
+
+            if missing:
+                await self._generate_images_fanout(
+                    prompt=prompt,
+                    indices=missing,
+                    quality=quality,
+                    size=size,
+                    output_format=output_format,
+                    on_image=on_image,
+                    references=references
+                )
+
+        await asyncio.gather(*[generate_chunk(chunk) for chunk in chunks])
 
     async def generate_multiple_images_parallel(
         self,
@@ -113,9 +345,16 @@ class ImageGeneratorService:
         images_url_list: Optional[List[str]] = None,
         save_directory: Optional[str] = None,
         filename_prefix: Optional[str] = None,
+        batch_mode: str = "n",
+        cache: Optional[str] = None,
+        on_result: Optional[Callable[[dict], Awaitable[None]]] = None,
+        partial_images: int = 0,
+        preview_key: Optional[str] = None,
+        completed: Optional[Dict[int, dict]] = None,
     ) -> dict:
         """
         Generate multiple images in parallel with the same prompt.
+        Each image is saved as soon as the call that produced it completes.
         
         Args:
             prompt: The prompt to generate images from
@@ -126,6 +365,16 @@ class ImageGeneratorService:
             images_url_list: Optional list of image file paths for editing
             save_directory: Directory to save images (optional)
             filename_prefix: Prefix for saved filenames (optional)
+            batch_mode: "n" to request several images per call, "fanout" for one call per image
+            cache: Opt-in generation cache: "reuse" serves identical earlier images from
+                disk, "refresh" regenerates and overwrites them (requires save_directory)
+            on_result: Optional coroutine called with each image's result entry as soon as
+                it is saved or fails, for progress reporting
+            partial_images: Stream each image and publish up to this many (1-3) partial
+                frames to the preview broker as "<preview_key>.<index>"
+            preview_key: Prefix of the preview ids (a random one is generated if omitted)
+            completed: Results of images an earlier run already saved (e.g. a resumed
+                job), by index; those indices are returned as-is and not generated
             
         Returns:
             Dictionary containing successful and failed results with metadata
@@ -133,83 +382,149 @@ class ImageGeneratorService:
         if count <= 0:
             raise ValueError("Count must be greater than 0")
         
-        if count > 10:  # OpenAI rate limiting consideration
-            raise ValueError("Count cannot exceed 10 images per batch")
+        max_batch_size = self.scheduler.max_batch_size
+        if count > max_batch_size:
+            raise ValueError(f"Count cannot exceed {max_batch_size} images per batch")
+
+        if cache and cache not in CACHE_MODES:
+            raise ValueError(f"cache must be one of {', '.join(CACHE_MODES)}")
 
+        if not 0 <= partial_images <= 3:
+            raise ValueError("partial_images must be between 0 and 3")
+        if partial_images and not preview_key:
+            preview_key = uuid.uuid4().hex
+
+        # Reference images are read once per process and shared across calls
+        references = None
+        upload_references = None
         if images_url_list:
-            images_list = []
-            for url in images_url_list:
-                img = open(url, "rb")
-                images_list.append(img)
-
-            tasks = []
-            for i in range(count):
-                task = self._generate_image_async(
-                    prompt=prompt,
-                    quality=quality,
-                    size=size,
-                    output_format=output_format,
-                    images_list=images_list,
-                    image_index=i,
+            references = await self.reference_cache.get_many_async(images_url_list)
+            # Uploads use copies downscaled to the output size; cache keys stay on the originals
+            upload_references = await self.reference_normalizer.normalize_many(references, size)
+
+        successful_by_index = {}
+        failed_by_index = {}
+        for index, result_data in (completed or {}).items():
+            if 0 <= index < count:
+                successful_by_index[index] = {**result_data, "resumed": True}
+
+        cache_keys = {}
+        if cache and save_directory:
+            generation_cache = get_generation_cache()
+            reference_hashes = [reference.content_hash for reference in references or []]
+            for index in range(count):
+                cache_keys[index] = generation_cache.make_key(
+                    prompt, reference_hashes, quality, size, output_format, index
                 )
-                tasks.append(task)       
-        else:      
-            tasks = []
-            for i in range(count):
-                task = self._generate_image_async(
-                    prompt=prompt,
-                    quality=quality,
-                    size=size,
-                    output_format=output_format,
-                    image_index=i
+
+        pending_indices = [index for index in range(count) if index not in successful_by_index]
+        if cache == "reuse" and cache_keys:
+            indices, pending_indices = pending_indices, []
+            for index in indices:
+                image_path = generate_image_path(
+                    save_directory,
+                    filename_prefix or "generated_image",
+                    index,
+                    output_format
                 )
-                tasks.append(task)
-   
+                if await generation_cache.lookup_async(cache_keys[index], image_path):
+                    successful_by_index[index] = {
+                        "index": index,
+                        "image_path": image_path,
+                        "status": "success",
+                        "cached": True
+                    }
+                    self.derivatives.schedule(image_path)
+                    if partial_images:
+                        preview_id = f"{preview_key}.{index}"
+                        successful_by_index[index]["preview_id"] = preview_id
+                        await self.preview_broker.complete(preview_id, image_path)
+                    if on_result:
+                        await on_result(successful_by_index[index])
+                else:
+                    pending_indices.append(index)
 
-        # Execute all tasks in parallel
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Process results and handle any exceptions
-        successful_results = []
-        failed_results = []
-        
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                failed_results.append({
-                    "index": i,
-                    "error": str(result),
+        async def on_image(index: int, item: Any) -> None:
+            preview_id = f"{preview_key}.{index}" if partial_images else None
+            if isinstance(item, Exception):
+                failed_by_index[index] = {
+                    "index": index,
+                    "error": str(item),
                     "status": "failed"
-                })
-            else:
-                # Save image if directory is provided
-                if save_directory:
-                    image_path = generate_image_path(
-                        save_directory, 
-                        filename_prefix or "generated_image",
-                        i,
-                        output_format
-                    )
-                    try:
-                        save_image(result, image_path)
-                        result_data = {
-                            "index": i,
-                            "image_path": image_path,
-                            "status": "success"
-                        }
-                    except Exception as e:
-                        result_data = {
-                            "index": i,
-                            "error": f"Failed to save image: {str(e)}",
-                            "status": "save_failed"
-                        }
-                else:
-                    # For responses without saving, include basic result info
+                }
+                if preview_id:
+                    failed_by_index[index]["preview_id"] = preview_id
+                    self.preview_broker.fail(preview_id, str(item))
+                if on_result:
+                    await on_result(failed_by_index[index])
+                return
+
+            # Save image if directory is provided
+            if save_directory:
+                image_path = generate_image_path(
+                    save_directory,
+                    filename_prefix or "generated_image",
+                    index,
+                    output_format
+                )
+                try:
+                    await save_image_data_async(item, image_path, output_format)
+                    if index in cache_keys:
+                        await generation_cache.put_async(cache_keys[index], image_path, output_format)
+                    # Thumbnails/previews are built in the background
+                    self.derivatives.schedule(image_path)
                     result_data = {
-                        "index": i,
+                        "index": index,
+                        "image_path": image_path,
                         "status": "success"
                     }
-                
-                successful_results.append(result_data)
+                except Exception as e:
+                    result_data = {
+                        "index": index,
+                        "error": f"Failed to save image: {str(e)}",
+                        "status": "save_failed"
+                    }
+            else:
+                # For responses without saving, include basic result info
+                result_data = {
+                    "index": index,
+                    "status": "success"
+                }
+
+            if preview_id:
+                result_data["preview_id"] = preview_id
+                await self.preview_broker.complete(preview_id, result_data.get("image_path"))
+
+            successful_by_index[index] = result_data
+            if on_result:
+                await on_result(result_data)
+
+        # Streamed images are one per call, so partial previews imply fan-out
+        if batch_mode == "n" and self.n_supported and len(pending_indices) > 1 and not partial_images:
+            await self._generate_images_batched(
+                prompt=prompt,
+                indices=pending_indices,
+                quality=quality,
+                size=size,
+                output_format=output_format,
+                on_image=on_image,
+                references=upload_references
+            )
+        else:
+            await self._generate_images_fanout(
+                prompt=prompt,
+                indices=pending_indices,
+                quality=quality,
+                size=size,
+                output_format=output_format,
+                on_image=on_image,
+                references=upload_references,
+                partial_images=partial_images,
+                preview_key=preview_key
+            )
+
+        successful_results = [successful_by_index[i] for i in sorted(successful_by_index)]
+        failed_results = [failed_by_index[i] for i in sorted(failed_by_index)]
 
         return {
             "successful": successful_results,
@@ -220,5 +535,23 @@ class ImageGeneratorService:
         }
 
 
+def _is_n_rejected(error: Any) -> bool:
+    """
+    Whether an images API error means the `n` parameter itself was refused.
+    """
+    if not isinstance(error, openai.BadRequestError):
+        return False
+    return getattr(error, "param", None) == "n" or "'n'" in str(error)
+
+
+_image_generator_service: Optional[ImageGeneratorService] = None
+
 def get_image_generator_service() -> ImageGeneratorService:
-    return ImageGeneratorService()
+    """
+    Return the process-wide service so every request shares one
+    AsyncOpenAI client (and its HTTP connection pool).
+    """
+    global _image_generator_service
+    if _image_generator_service is None:
+        _image_generator_service = ImageGeneratorService()
+    return _image_generator_service
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+from utils.sqlite_store import SQLiteStore
+
+load_dotenv()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    progress TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class JobProgress:
+    """
+    Accumulates the events a job body emits and persists them, so
+    GET /images/jobs/{id} can report per-day/per-image progress and the
+    partial results produced so far.
+
+    The saved images recorded here are also what a resumed job skips: see
+    restore() and completed_images().
+    """
+
+    def __init__(self, service: "ImageJobService", job_id: str):
+        self.service = service
+        self.job_id = job_id
+        self.state: Dict[str, Any] = {
+            "total_images": 0,
+            "completed_images": 0,
+            "failed_images": 0,
+            "days": {},
+            "images": [],
+        }
+
+    def restore(self, previous: Dict[str, Any]) -> None:
+        """
+        Carry over the images an interrupted run already saved (and that
+        are still on disk); failed ones are dropped so they're retried.
+        Blocking (stats files): call through asyncio.to_thread.
+        """
+        images = [
+            image for image in previous.get("images", [])
+            if image.get("status") == "success" and image.get("image_path") and os.path.exists(image["image_path"])
+        ]
+        self.state["images"] = images
+        self.state["completed_images"] = len(images)
+
+    def completed_images(self, day: Optional[str] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Saved images of `day` (None for batch jobs) by index, as results
+        generate_multiple_images_parallel can reuse instead of regenerating.
+        """
+        return {
+            image["index"]: {k: v for k, v in image.items() if k != "day"}
+            for image in self.state["images"]
+            if image.get("day") == day and image.get("status") == "success"
+        }
+
+    async def set_total(self, total_images: int) -> None:
+        self.state["total_images"] = total_images
+        await self._save()
+
+    async def __call__(self, event: Dict[str, Any]) -> None:
+        kind = event.get("event", "image")
+        day = event.get("day")
+
+        if kind == "image":
+            image = {k: v for k, v in event.items() if k != "event"}
+            self.state["images"].append(image)
+            if image.get("status") == "success":
+                self.state["completed_images"] += 1
+            else:
+                self.state["failed_images"] += 1
+        elif day is not None:
+            day_state = self.state["days"].setdefault(day, {})
+            day_state["status"] = kind.replace("day_", "")
+            if "error" in event:
+                day_state["error"] = event["error"]
+
+        await self._save()
+
+    async def _save(self) -> None:
+        await self.service.update_progress(self.job_id, self.state)
+
+
+JobHandler = Callable[[Dict[str, Any], JobProgress], Awaitable[Dict[str, Any]]]
+
+
+class ImageJobService:
+    """
+    Background job queue for long-running image endpoints.
+
+    Jobs are persisted in SQLite and executed by a bounded pool of asyncio
+    workers; queued or interrupted jobs are picked up again on start, so a
+    restart doesn't lose them. An interrupted job resumes: the images it
+    already saved are kept and only the rest are generated.
+    """
+
+    def __init__(self, db_path: str, num_workers: int):
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self.num_workers = num_workers
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the coroutine that runs jobs of `kind`. It receives the
+        stored request payload and a JobProgress callback, and returns the
+        job result.
+        """
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+
+        # Jobs that were running when the process stopped are resumed
+        await asyncio.to_thread(
+            self.store.execute,
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),),
+        )
+        pending = await asyncio.to_thread(
+            self.store.fetchall, "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+        )
+        for row in pending:
+            self._queue.put_nowait(row["id"])
+        if pending:
+            print(f"🔁 Re-queued {len(pending)} image jobs")
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, request: Dict[str, Any]) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if self._queue is None:
+            raise RuntimeError("Job workers are not running")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await asyncio.to_thread(
+            self.store.execute,
+            "INSERT INTO jobs (id, kind, status, request, progress, created_at, updated_at) VALUES (?, ?, 'queued', ?, '{}', ?, ?)",
+            (job_id, kind, json.dumps(request), now, now),
+        )
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = await asyncio.to_thread(self.store.fetchone, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    async def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            self.store.execute,
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(progress), time.time(), job_id),
+        )
+
+    async def _set_status(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        await asyncio.to_thread(
+            self.store.execute,
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        row = await asyncio.to_thread(
+            self.store.fetchone, "SELECT kind, request, progress FROM jobs WHERE id = ?", (job_id,)
+        )
+        if row is None:
+            return
+
+        await self._set_status(job_id, "running")
+        progress = JobProgress(self, job_id)
+        await asyncio.to_thread(progress.restore, json.loads(row["progress"]))
+        if progress.state["images"]:
+            print(f"🔁 Resuming job {job_id} with {len(progress.state['images'])} images already saved")
+        try:
+            handler = self._handlers[row["kind"]]
+            result = await handler(json.loads(row["request"]), progress)
+        except asyncio.CancelledError:
+            # Shutting down: leave the job as running so start() re-queues it
+            raise
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            await self._set_status(job_id, "failed", error=str(e))
+        else:
+            await self._set_status(job_id, "completed", result=result)
+
+
+_image_job_service: Optional[ImageJobService] = None
+
+def get_image_job_service() -> ImageJobService:
+    """
+    Process-wide job service, configured through IMAGE_JOBS_DB and
+    IMAGE_JOB_WORKERS.
+    """
+    global _image_job_service
+    if _image_job_service is None:
+        _image_job_service = ImageJobService(
+            db_path=os.getenv("IMAGE_JOBS_DB", "data/image_jobs.sqlite3"),
+            num_workers=int(os.getenv("IMAGE_JOB_WORKERS", "2")),
+        )
+    return _image_job_service
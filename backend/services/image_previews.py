@@ -0,0 +1,166 @@
+import asyncio
+import base64
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import xxhash
+from dotenv import load_dotenv
+
+from services.derivatives import public_url
+from utils.images_utils import write_image_bytes
+
+load_dotenv()
+
+# Client-supplied preview keys are limited to this; frame directories are
+# named by a hash of the image id either way
+PREVIEW_KEY_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def validate_preview_key(preview_key: str) -> None:
+    if not PREVIEW_KEY_PATTERN.fullmatch(preview_key):
+        raise ValueError("preview_key must be 1-64 characters of A-Z, a-z, 0-9, '_' or '-'")
+
+
+class PreviewState:
+    """
+    Partial frames and final result of one streamed image.
+    """
+
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.subscribers: List[asyncio.Queue] = []
+        self.done = False
+        self.updated_at = time.time()
+
+
+class ImagePreviewBroker:
+    """
+    Stores the low-fidelity partial frames gpt-image-1 streams for an image
+    and fans them out to SSE subscribers. When the final image is saved the
+    partial files are deleted and subscribers get a "completed" event
+    pointing at it. Events carry both the file path and its public URL
+    (None when the file is outside the static mounts).
+
+    Image ids are chosen by the caller (e.g. "<job_id>.<day>.<index>"), so a
+    client can subscribe before the first frame arrives. They never become
+    paths: each image's frames live in a directory named by a hash of its id.
+    """
+
+    def __init__(self, root: str, max_images: int):
+        self.root = Path(root)
+        self.max_images = max_images
+        self._states: "OrderedDict[str, PreviewState]" = OrderedDict()
+
+    def _frame_dir(self, image_id: str) -> Path:
+        return self.root / xxhash.xxh3_128_hexdigest(image_id.encode("utf-8"))
+
+    def _state(self, image_id: str) -> PreviewState:
+        state = self._states.get(image_id)
+        if state is None:
+            state = self._states[image_id] = PreviewState()
+            while len(self._states) > self.max_images:
+                evicted_id, evicted = self._states.popitem(last=False)
+                if not evicted.subscribers:
+                    shutil.rmtree(self._frame_dir(evicted_id), ignore_errors=True)
+        return state
+
+    def _publish(self, image_id: str, event: Dict[str, Any]) -> None:
+        state = self._state(image_id)
+        state.events.append(event)
+        state.updated_at = time.time()
+        for queue in state.subscribers:
+            queue.put_nowait(event)
+
+    async def add_partial(self, image_id: str, partial_index: int, image_base64: str, output_format: str) -> str:
+        """
+        Persist one partial frame and notify subscribers. Returns its path.
+        """
+        frame_dir = self._frame_dir(image_id)
+        frame_path = frame_dir / f"partial_{partial_index}.{output_format}"
+
+        def write() -> None:
+            frame_dir.mkdir(parents=True, exist_ok=True)
+            write_image_bytes(base64.b64decode(image_base64), str(frame_path))
+
+        await asyncio.to_thread(write)
+        self._publish(image_id, {
+            "event": "partial",
+            "image_id": image_id,
+            "partial_index": partial_index,
+            "path": str(frame_path),
+            "url": public_url(str(frame_path)),
+        })
+        return str(frame_path)
+
+    async def complete(self, image_id: str, image_path: Optional[str]) -> None:
+        """
+        The final image replaces the partials: frames are removed from disk
+        and from the replay history.
+        """
+        await asyncio.to_thread(shutil.rmtree, self._frame_dir(image_id), True)
+        state = self._state(image_id)
+        state.events = []
+        self._publish(image_id, {
+            "event": "completed",
+            "image_id": image_id,
+            "path": image_path,
+            "url": public_url(image_path) if image_path else None,
+        })
+        state.done = True
+
+    def fail(self, image_id: str, error: str) -> None:
+        state = self._state(image_id)
+        self._publish(image_id, {"event": "failed", "image_id": image_id, "error": error})
+        state.done = True
+
+    async def subscribe(self, image_id: str, timeout: float = 300.0) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Replay the frames seen so far, then yield live events until the
+        image completes or fails (or `timeout` seconds pass without events).
+        """
+        state = self._state(image_id)
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in state.events:
+            queue.put_nowait(event)
+        if state.done:
+            while not queue.empty():
+                yield queue.get_nowait()
+            return
+
+        state.subscribers.append(queue)
+        try:
+            while True:
+                event = await asyncio.wait_for(queue.get(), timeout=timeout)
+                yield event
+                if event["event"] in ("completed", "failed"):
+                    return
+        except asyncio.TimeoutError:
+            return
+        finally:
+            state.subscribers.remove(queue)
+
+    def get(self, image_id: str) -> Optional[Dict[str, Any]]:
+        state = self._states.get(image_id)
+        if state is None:
+            return None
+        return {"image_id": image_id, "done": state.done, "events": list(state.events)}
+
+
+_image_preview_broker: Optional[ImagePreviewBroker] = None
+
+def get_image_preview_broker() -> ImagePreviewBroker:
+    """
+    Process-wide preview broker; frames live under IMAGE_PREVIEWS_DIR.
+    """
+    global _image_preview_broker
+    if _image_preview_broker is None:
+        _image_preview_broker = ImagePreviewBroker(
+            root=os.getenv("IMAGE_PREVIEWS_DIR", "images_generated/_partials"),
+            max_images=int(os.getenv("IMAGE_PREVIEWS_MAX_IMAGES", "1000")),
+        )
+    return _image_preview_broker
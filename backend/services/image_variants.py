@@ -0,0 +1,277 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+from PIL import Image, features
+
+from utils.images_utils import normalize_format
+from utils.sqlite_store import SQLiteStore
+from utils.static_files import parse_accept_header
+from utils.workers import run_in_process
+
+load_dotenv()
+
+# Formats the variant cache can decode and serve, with their media types
+IMAGE_MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+# Modern formats offered to clients that list them in Accept, best first
+PREFERRED_FORMATS = ("avif", "webp")
+
+# Formats every client can display
+UNIVERSAL_FORMATS = ("jpeg", "png")
+
+# Allowed values for ?w= (requested widths round up to the next one)
+VARIANT_WIDTHS = (256, 512, 768, 1024, 1536, 2048)
+
+_SAVE_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": 60},
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 85, "optimize": True, "progressive": True},
+    "png": {"format": "PNG", "optimize": True},
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS variants (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS variants_last_access ON variants (last_access);
+"""
+
+
+def transcode_variant(source_path: str, destination: str, output_format: str, width: int) -> int:
+    """
+    Re-encode `source_path` as `output_format`, no wider than `width`
+    (0 keeps the original size). CPU-bound: runs in the process pool.
+
+    Returns the size in bytes of the written file.
+    """
+    with Image.open(source_path) as image:
+        image.load()
+        if width and image.width > width:
+            image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+
+        if output_format == "jpeg" and image.mode not in ("RGB", "L"):
+            # Flatten transparency onto white instead of letting it turn black
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA")
+
+        Path(destination).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{destination}.tmp"
+        image.save(tmp_path, **_SAVE_OPTIONS[output_format])
+        os.replace(tmp_path, destination)
+    return os.path.getsize(destination)
+
+
+def normalize_width(value: Optional[str]) -> int:
+    """
+    Map a ?w= query value onto VARIANT_WIDTHS; 0 means original size.
+    """
+    try:
+        width = int(value) if value else 0
+    except ValueError:
+        return 0
+    if width <= 0:
+        return 0
+    for allowed in VARIANT_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return VARIANT_WIDTHS[-1]
+
+
+class Variant(NamedTuple):
+    # File to serve instead of the original, or None to serve the original
+    path: Optional[str]
+    # True while the variant is still being built; the original is a stand-in
+    pending: bool = False
+
+
+class ImageVariantService:
+    """
+    Content negotiation for images served from the static mounts.
+
+    Picks AVIF/WebP/JPEG from the client's Accept header, transcodes once
+    in the process pool and keeps the result in a bounded on-disk cache
+    keyed by source content hash + format + width. Requests wait up to
+    `wait_seconds` for a new transcode; past that the original is served
+    and the transcode finishes in the background for the next request.
+    """
+
+    def __init__(self, root: str, db_path: str, max_bytes: int, wait_seconds: float):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.wait_seconds = wait_seconds
+        self.formats = tuple(f for f in PREFERRED_FORMATS if features.check(f))
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+
+    @staticmethod
+    def source_format(path: str) -> Optional[str]:
+        source_format = normalize_format(Path(path).suffix)
+        return source_format if source_format in IMAGE_MEDIA_TYPES else None
+
+    def choose_format(self, accept: str, source_format: str) -> str:
+        """
+        Best format the client explicitly accepts. Browsers send */* even
+        when they can't decode AVIF/WebP, so wildcards don't count.
+        """
+        accepted = parse_accept_header(accept)
+        for output_format in self.formats:
+            if IMAGE_MEDIA_TYPES[output_format] in accepted:
+                return output_format
+        if source_format in UNIVERSAL_FORMATS:
+            return source_format
+        return "jpeg"
+
+    def _variant_path(self, source_hash: str, output_format: str, width: int) -> Path:
+        return self.root / source_hash[:2] / f"{source_hash}_{width}.{output_format}"
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        row = self.store.fetchone("SELECT path, size_bytes FROM variants WHERE key = ?", (key,))
+        if row is None or not os.path.exists(row["path"]):
+            return None
+        self.store.execute("UPDATE variants SET last_access = ? WHERE key = ?", (time.time(), key))
+        return {"path": row["path"], "size_bytes": row["size_bytes"]}
+
+    def _record(self, key: str, path: str, size_bytes: int) -> None:
+        now = time.time()
+        self.store.execute(
+            "INSERT OR REPLACE INTO variants (key, path, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, path, size_bytes, now, now),
+        )
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop least recently used variants until the cache fits in `max_bytes`.
+        """
+        total = self.store.fetchone("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM variants")["total"]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for row in self.store.fetchall("SELECT key, path, size_bytes FROM variants ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append(row)
+            total -= row["size_bytes"]
+        for row in victims:
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+        self.store.executemany("DELETE FROM variants WHERE key = ?", [(row["key"],) for row in victims])
+
+    async def _transcode(self, key: str, source_path: str, output_format: str, width: int, source_hash: str) -> Dict:
+        destination = str(self._variant_path(source_hash, output_format, width))
+        size_bytes = await run_in_process(transcode_variant, source_path, destination, output_format, width)
+        await asyncio.to_thread(self._record, key, destination, size_bytes)
+        return {"path": destination, "size_bytes": size_bytes}
+
+    def _start_transcode(self, key: str, source_path: str, output_format: str, width: int, source_hash: str) -> asyncio.Future:
+        future = self._in_flight.get(key)
+        if future is not None:
+            return future
+
+        future = self._in_flight[key] = asyncio.ensure_future(
+            self._transcode(key, source_path, output_format, width, source_hash)
+        )
+
+        def done(future: asyncio.Future) -> None:
+            self._in_flight.pop(key, None)
+            if not future.cancelled() and future.exception() is not None:
+                self._failures += 1
+                print(f"⚠️  Could not transcode {source_path} to {output_format}: {future.exception()}")
+
+        future.add_done_callback(done)
+        return future
+
+    async def negotiate(
+        self,
+        source_path: str,
+        source_hash: str,
+        source_size: int,
+        accept: str,
+        requested_width: Optional[str] = None,
+    ) -> Variant:
+        """
+        Decide what to send for `source_path` given the request's Accept
+        header and ?w= value.
+        """
+        width = normalize_width(requested_width)
+        source_format = self.source_format(source_path)
+        output_format = self.choose_format(accept, source_format)
+        if output_format == source_format and not width:
+            return Variant(None)
+
+        key = f"{source_hash}:{output_format}:{width}"
+        variant = await asyncio.to_thread(self._lookup, key)
+        if variant is not None:
+            self._hits += 1
+        else:
+            self._misses += 1
+            future = self._start_transcode(key, source_path, output_format, width, source_hash)
+            try:
+                variant = await asyncio.wait_for(asyncio.shield(future), timeout=self.wait_seconds)
+            except asyncio.TimeoutError:
+                return Variant(None, pending=True)
+            except Exception:
+                return Variant(None)
+
+        # Keep the original when it is already acceptable and the
+        # transcode didn't make it any smaller
+        original_acceptable = (
+            source_format in UNIVERSAL_FORMATS
+            or IMAGE_MEDIA_TYPES[source_format] in parse_accept_header(accept)
+        )
+        if original_acceptable and not width and variant["size_bytes"] >= source_size:
+            return Variant(None)
+        return Variant(variant["path"])
+
+    def get_stats(self) -> dict:
+        row = self.store.fetchone("SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS total FROM variants")
+        return {
+            "formats": list(self.formats) + ["jpeg"],
+            "entries": row["entries"],
+            "total_bytes": row["total"],
+            "max_bytes": self.max_bytes,
+            "in_flight": len(self._in_flight),
+            "hits": self._hits,
+            "misses": self._misses,
+            "failures": self._failures,
+        }
+
+
+_image_variant_service: Optional[ImageVariantService] = None
+
+def get_image_variant_service() -> ImageVariantService:
+    """
+    Process-wide variant cache, configured through IMAGE_VARIANTS_DIR,
+    IMAGE_VARIANTS_DB, IMAGE_VARIANTS_MAX_MB and IMAGE_VARIANTS_WAIT_MS.
+    """
+    global _image_variant_service
+    if _image_variant_service is None:
+        _image_variant_service = ImageVariantService(
+            root=os.getenv("IMAGE_VARIANTS_DIR", "images_generated/_variants"),
+            db_path=os.getenv("IMAGE_VARIANTS_DB", "data/image_variants.sqlite3"),
+            max_bytes=int(float(os.getenv("IMAGE_VARIANTS_MAX_MB", "1024")) * 1024 * 1024),
+            wait_seconds=float(os.getenv("IMAGE_VARIANTS_WAIT_MS", "1500")) / 1000,
+        )
+    return _image_variant_service
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Literal, Optional, get_args
+
+import xxhash
+import zstandard
+from dotenv import load_dotenv
+
+from utils.sqlite_store import SQLiteStore
+
+load_dotenv()
+
+# "reuse" answers from the cache when possible, "refresh" always calls
+# upstream and overwrites the entry, "bypass" neither reads nor writes it
+LLMCacheMode = Literal["reuse", "refresh", "bypass"]
+LLM_CACHE_MODES = get_args(LLMCacheMode)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    raw_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+class LLMResponseCache:
+    """
+    Persistent cache of chat completion responses.
+
+    Entries are keyed by an xxhash of the full request (model, messages and
+    every other parameter, with whitespace in messages normalized), stored
+    zstd-compressed in SQLite and expire after `ttl_seconds`. Once the
+    compressed payloads exceed `max_bytes` the least recently used ones
+    are evicted.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_bytes: int, level: int = 3):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.level = level
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self._hits = 0
+        self._misses = 0
+        self._bypassed = 0
+
+    @staticmethod
+    def make_key(params: Dict[str, Any]) -> str:
+        """
+        Hash of the request with runs of whitespace in message contents
+        collapsed, so re-submitted forms that only differ in spacing match.
+        """
+        normalized = dict(params)
+        if "messages" in normalized:
+            normalized["messages"] = [
+                {**message, "content": " ".join(message["content"].split())}
+                if isinstance(message.get("content"), str) else message
+                for message in normalized["messages"]
+            ]
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+        return xxhash.xxh3_128_hexdigest(payload.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Cached content for `key`, or None on a miss (unknown or expired).
+        """
+        row = self.store.fetchone("SELECT payload, created_at FROM responses WHERE key = ?", (key,))
+        now = time.time()
+        if row is None or now - row["created_at"] > self.ttl_seconds:
+            self._misses += 1
+            return None
+
+        self.store.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self._hits += 1
+        # Decompressors aren't thread-safe; one per call is cheap
+        return zstandard.ZstdDecompressor().decompress(row["payload"]).decode("utf-8")
+
+    def put(self, key: str, model: str, content: str) -> None:
+        raw = content.encode("utf-8")
+        payload = zstandard.ZstdCompressor(level=self.level).compress(raw)
+        now = time.time()
+        self.store.execute(
+            "INSERT OR REPLACE INTO responses (key, model, payload, size_bytes, raw_bytes, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, model, payload, len(payload), len(raw), now, now),
+        )
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Drop expired entries, then least recently used ones until the
+        payloads fit in `max_bytes`.
+        """
+        self.store.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+        total = self.store.fetchone("SELECT COALESCE(SUM(size_bytes), 0) AS total FROM responses")["total"]
+        if total <= self.max_bytes:
+            return
+
+        victims = []
+        for row in self.store.fetchall("SELECT key, size_bytes FROM responses ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append((row["key"],))
+            total -= row["size_bytes"]
+        self.store.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def put_async(self, key: str, model: str, content: str) -> None:
+        await asyncio.to_thread(self.put, key, model, content)
+
+    def record_bypass(self) -> None:
+        self._bypassed += 1
+
+    def get_stats(self) -> dict:
+        row = self.store.fetchone(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS total, "
+            "COALESCE(SUM(raw_bytes), 0) AS raw FROM responses"
+        )
+        return {
+            "entries": row["entries"],
+            "total_bytes": row["total"],
+            "uncompressed_bytes": row["raw"],
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+            "bypassed": self._bypassed,
+        }
+
+
+_llm_response_cache: Optional[LLMResponseCache] = None
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """
+    Process-wide LLM response cache, configured through LLM_CACHE_DB,
+    LLM_CACHE_TTL_HOURS and LLM_CACHE_MAX_MB.
+    """
+    global _llm_response_cache
+    if _llm_response_cache is None:
+        _llm_response_cache = LLMResponseCache(
+            db_path=os.getenv("LLM_CACHE_DB", "data/llm_cache.sqlite3"),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "24")) * 3600,
+            max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+        )
+    return _llm_response_cache
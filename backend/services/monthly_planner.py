@@ -5,6 +5,7 @@ from openai import OpenAI
 from pydantic import BaseModel
 from enum import Enum
 from dotenv import load_dotenv
+from services.chat_completions import get_chat_completion_client
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -41,26 +42,10 @@ class MonthlyPlannerService:
             Diccionario con la planificación por semana
         """
         
-        # Construir el prompt para el agente de OpenAI
-        prompt = self._build_prompt(monthly_strategy, brand_context, month_name)
-        
         try:
             # Llamar a OpenAI
             response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un estratega de marketing digital experto especializado en planificación de mediano plazo. Debes dividir estrategias mensuales en planificaciones semanales coherentes y ejecutables. Genera respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=2500,
-                response_format={"type": "json_object"}
+                **self._build_request(monthly_strategy, brand_context, month_name)
             )
             
             # Parsear la respuesta
@@ -72,6 +57,58 @@ class MonthlyPlannerService:
         except Exception as e:
             raise Exception(f"Error al generar el plan mensual: {str(e)}")
     
+    async def generate_monthly_plan_async(
+        self,
+        monthly_strategy: str,
+        brand_context: Optional[str] = None,
+        month_name: Optional[str] = None,
+        cache: str = "reuse"
+    ) -> Dict[str, Any]:
+        """
+        Igual que generate_monthly_plan, pero con el cliente AsyncOpenAI
+        compartido: la llamada no bloquea el event loop. `cache` ("reuse",
+        "refresh" o "bypass") controla la caché de respuestas.
+        """
+        try:
+            content = await get_chat_completion_client().create(
+                cache=cache,
+                **self._build_request(monthly_strategy, brand_context, month_name)
+            )
+            return json.loads(content)
+            
+        except Exception as e:
+            raise Exception(f"Error al generar el plan mensual: {str(e)}")
+    
+    def _build_request(
+        self,
+        monthly_strategy: str,
+        brand_context: Optional[str] = None,
+        month_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Parámetros de la llamada a chat.completions del monthly planner.
+        """
+        
+        # Construir el prompt para el agente de OpenAI
+        prompt = self._build_prompt(monthly_strategy, brand_context, month_name)
+        
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Eres un estratega de marketing digital experto especializado en planificación de mediano plazo. Debes dividir estrategias mensuales en planificaciones semanales coherentes y ejecutables. Genera respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.7,
+            max_tokens=2500,
+            response_format={"type": "json_object"}
+        )
+    
     def _build_prompt(
         self,
         monthly_strategy: str,
@@ -0,0 +1,128 @@
+import asyncio
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from io import BytesIO
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import xxhash
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+@dataclass(frozen=True)
+class CachedReference:
+    """
+    Immutable contents of a reference image, read once from disk.
+    """
+    path: str
+    mtime_ns: int
+    size: int
+    data: bytes
+
+    @property
+    def filename(self) -> str:
+        return Path(self.path).name
+
+    @cached_property
+    def content_hash(self) -> str:
+        """xxh3-128 of the file contents, computed on first use."""
+        return xxhash.xxh3_128_hexdigest(self.data)
+
+    @property
+    def mime_type(self) -> str:
+        return mimetypes.guess_type(self.path)[0] or "application/octet-stream"
+
+    def open_view(self) -> Tuple[str, BytesIO, str]:
+        """
+        A fresh upload handle for one upstream call.
+        BytesIO shares the immutable bytes until written to, so every call
+        gets its own read position without copying the image.
+        """
+        return (self.filename, BytesIO(self.data), self.mime_type)
+
+
+class ReferenceImageCache:
+    """
+    LRU cache of reference images keyed by path, mtime and size, bounded by
+    the total number of cached bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedReference]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, path: str) -> CachedReference:
+        """
+        Return the cached reference for `path`, reading it if it is new or
+        has changed on disk since it was cached.
+        """
+        key = os.path.realpath(path)
+        stat = os.stat(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry
+
+        with open(key, "rb") as f:
+            data = f.read()
+        entry = CachedReference(path=path, mtime_ns=stat.st_mtime_ns, size=stat.st_size, data=data)
+
+        with self._lock:
+            self._misses += 1
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._total_bytes -= len(previous.data)
+            # Files larger than the whole budget are served but never cached
+            if len(data) <= self.max_bytes:
+                self._entries[key] = entry
+                self._total_bytes += len(data)
+                while self._total_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._total_bytes -= len(evicted.data)
+
+        return entry
+
+    def get_many(self, paths: List[str]) -> List[CachedReference]:
+        return [self.get(path) for path in paths]
+
+    async def get_many_async(self, paths: List[str]) -> List[CachedReference]:
+        """
+        Same as get_many, with any disk reads kept off the event loop.
+        """
+        return await asyncio.to_thread(self.get_many, paths)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+_reference_image_cache: Optional[ReferenceImageCache] = None
+
+def get_reference_image_cache() -> ReferenceImageCache:
+    """
+    Process-wide reference image cache, capped by REFERENCE_CACHE_MAX_MB.
+    """
+    global _reference_image_cache
+    if _reference_image_cache is None:
+        max_mb = float(os.getenv("REFERENCE_CACHE_MAX_MB", "256"))
+        _reference_image_cache = ReferenceImageCache(max_bytes=int(max_mb * 1024 * 1024))
+    return _reference_image_cache
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from services.reference_cache import CachedReference, ReferenceImageCache, get_reference_image_cache
+from utils.sqlite_store import SQLiteStore
+from utils.workers import run_in_process
+
+load_dotenv()
+
+# Longest side used when the generation size is "auto"
+DEFAULT_MAX_SIDE = 1536
+
+# Longest sides of the gpt-image-1 output sizes (1024x1024, 1536x1024,
+# 1024x1536); new resources are normalized for these ahead of time
+PRENORMALIZE_SIDES = (1024, 1536)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS normalized_references (
+    key TEXT PRIMARY KEY,
+    path TEXT,
+    source_size INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+def max_side_for_size(size: str) -> int:
+    """
+    Longest side of a "WxH" generation size.
+    """
+    try:
+        width, height = (int(value) for value in size.lower().split("x"))
+    except ValueError:
+        return DEFAULT_MAX_SIDE
+    return max(width, height)
+
+
+def normalize_reference(source_path: str, stem: str, max_side: int) -> Optional[str]:
+    """
+    Downscale `source_path` to at most `max_side` on its longest side and
+    re-encode it as `stem`.jpeg (or `stem`.webp when it has transparency).
+    The copy is only kept when it comes out smaller than the source.
+    CPU-bound: runs in the process pool.
+
+    Returns the written path, or None if the source should be uploaded as-is.
+    """
+    with Image.open(source_path) as image:
+        image.load()
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            destination = f"{stem}.webp"
+            options = {"format": "WEBP", "quality": 90, "method": 4}
+        else:
+            image = image.convert("RGB")
+            destination = f"{stem}.jpeg"
+            options = {"format": "JPEG", "quality": 90, "optimize": True}
+
+        Path(destination).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{destination}.tmp"
+        image.save(tmp_path, **options)
+
+    if os.path.getsize(tmp_path) >= os.path.getsize(source_path):
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, destination)
+    return destination
+
+
+class ReferenceNormalizer:
+    """
+    Upload-sized copies of reference images for images.edit.
+
+    Each reference is downscaled to the longest side of the requested
+    generation size and re-encoded once in the process pool; the copy is
+    keyed by source content hash + target side and recorded in a SQLite
+    manifest, so repeated edits (and other processes) reuse it. When the
+    copy wouldn't be smaller, or the source can't be decoded, the original
+    is uploaded.
+    """
+
+    def __init__(self, root: str, db_path: str, reference_cache: ReferenceImageCache):
+        self.root = Path(root)
+        self.reference_cache = reference_cache
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._background = set()
+        self._hits = 0
+        self._misses = 0
+        self._failures = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+
+    def _normalized_path(self, source_hash: str, max_side: int) -> Path:
+        return self.root / source_hash[:2] / f"{source_hash}_{max_side}"
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        row = self.store.fetchone("SELECT path, size_bytes FROM normalized_references WHERE key = ?", (key,))
+        if row is None or (row["path"] is not None and not os.path.exists(row["path"])):
+            return None
+        return {"path": row["path"], "size_bytes": row["size_bytes"]}
+
+    async def _normalize(self, key: str, reference: CachedReference, max_side: int) -> Dict:
+        stem = str(self._normalized_path(reference.content_hash, max_side))
+        destination = await run_in_process(normalize_reference, reference.path, stem, max_side)
+        size_bytes = os.path.getsize(destination) if destination else reference.size
+
+        await asyncio.to_thread(
+            self.store.execute,
+            "INSERT OR REPLACE INTO normalized_references (key, path, source_size, size_bytes, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, destination, reference.size, size_bytes, time.time()),
+        )
+        return {"path": destination, "size_bytes": size_bytes}
+
+    def _start(self, key: str, reference: CachedReference, max_side: int) -> asyncio.Future:
+        future = self._in_flight.get(key)
+        if future is None:
+            future = self._in_flight[key] = asyncio.ensure_future(self._normalize(key, reference, max_side))
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return future
+
+    async def normalize(self, reference: CachedReference, size: str) -> CachedReference:
+        """
+        The reference to upload for a generation of `size`: the normalized
+        copy, or `reference` itself if there's nothing to gain.
+        """
+        max_side = max_side_for_size(size)
+        key = f"{reference.content_hash}:{max_side}"
+        normalized = await asyncio.to_thread(self._lookup, key)
+        if normalized is not None:
+            self._hits += 1
+        else:
+            self._misses += 1
+            try:
+                normalized = await asyncio.shield(self._start(key, reference, max_side))
+            except Exception as e:
+                self._failures += 1
+                print(f"⚠️  Could not normalize reference {reference.path}: {e}")
+                return reference
+
+        self._bytes_in += reference.size
+        if normalized["path"] is None:
+            self._bytes_out += reference.size
+            return reference
+        self._bytes_out += normalized["size_bytes"]
+        return await asyncio.to_thread(self.reference_cache.get, normalized["path"])
+
+    async def normalize_many(self, references: List[CachedReference], size: str) -> List[CachedReference]:
+        return list(await asyncio.gather(*[self.normalize(reference, size) for reference in references]))
+
+    def schedule(self, path: str) -> None:
+        """
+        Normalize a new resource for every gpt-image-1 output size in the
+        background, so its first edit call doesn't wait for it.
+        """
+        async def prepare() -> None:
+            reference = await asyncio.to_thread(self.reference_cache.get, path)
+            for max_side in PRENORMALIZE_SIDES:
+                await self.normalize(reference, f"{max_side}x{max_side}")
+
+        task = asyncio.create_task(prepare())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def get_stats(self) -> dict:
+        row = self.store.fetchone(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(CASE WHEN path IS NULL THEN 0 ELSE size_bytes END), 0) AS total "
+            "FROM normalized_references"
+        )
+        return {
+            "entries": row["entries"],
+            "total_bytes": row["total"],
+            "in_flight": len(self._in_flight),
+            "hits": self._hits,
+            "misses": self._misses,
+            "failures": self._failures,
+            "uploaded_bytes_original": self._bytes_in,
+            "uploaded_bytes_normalized": self._bytes_out,
+        }
+
+
+_reference_normalizer: Optional[ReferenceNormalizer] = None
+
+def get_reference_normalizer() -> ReferenceNormalizer:
+    """
+    Process-wide reference normalizer; copies live under
+    REFERENCE_NORMALIZED_DIR and the manifest in REFERENCE_NORMALIZED_DB.
+    """
+    global _reference_normalizer
+    if _reference_normalizer is None:
+        _reference_normalizer = ReferenceNormalizer(
+            root=os.getenv("REFERENCE_NORMALIZED_DIR", "images_generated/_references"),
+            db_path=os.getenv("REFERENCE_NORMALIZED_DB", "data/normalized_references.sqlite3"),
+            reference_cache=get_reference_image_cache(),
+        )
+    return _reference_normalizer
@@ -0,0 +1,223 @@
+import os
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.resource_index import ResourceIndex, get_resource_index
+
+load_dotenv()
+
+# Filename endings that mark a copy of another file ("x copy 2.webp", "x (1).webp")
+_COPY_SUFFIX = re.compile(r"( copy( \d+)?| \(\d+\))$", re.IGNORECASE)
+
+# Rows compared per step of the pairwise search (bounds the distance block to chunk x n)
+_CHUNK_SIZE = 1024
+
+
+def phash_to_int(phash: str) -> np.uint64:
+    return np.uint64(int(phash, 16))
+
+
+def canonical_sort_key(path: str) -> Tuple[bool, int, str]:
+    """
+    Order cluster members so the original beats "copy"/"(1)" variants and
+    shorter names win.
+    """
+    stem = Path(path).stem
+    return (bool(_COPY_SUFFIX.search(stem)), len(stem), path)
+
+
+class _Clusters:
+    def __init__(self, members: Dict[str, List[str]], cluster_of: Dict[str, str], rows: Dict[str, Dict[str, Any]]):
+        # representative -> members (representative first)
+        self.members = members
+        # path -> representative, only for paths in a cluster of 2+
+        self.cluster_of = cluster_of
+        # path -> index row the clusters were computed from
+        self.rows = rows
+
+    def ranks(self, category: Optional[str] = None) -> Dict[str, Tuple[str, int]]:
+        """
+        path -> (representative, position in its cluster) for clustered
+        paths, optionally only those in `category`; the shape
+        ResourceIndex.query takes to collapse duplicates before paginating.
+        """
+        return {
+            path: (representative, rank)
+            for representative, paths in self.members.items()
+            for rank, path in enumerate(paths)
+            if category is None or self.rows[path]["category"] == category
+        }
+
+
+class DuplicateDetector:
+    """
+    Near-duplicate clusters of indexed resources.
+
+    Two resources are duplicates when their perceptual hashes differ in at
+    most `threshold` bits (or, for files without a phash such as SVGs, when
+    their content hashes match). Distances are computed with vectorized
+    XOR + popcount over the whole index, and the clusters are cached until
+    the index changes.
+    """
+
+    def __init__(self, index: ResourceIndex, threshold: int):
+        self.index = index
+        self.threshold = threshold
+        self._cache: Dict[int, Tuple[int, _Clusters]] = {}
+        self._lock = threading.Lock()
+
+    def _rows(self) -> List[Dict[str, Any]]:
+        return [
+            dict(row) for row in self.index.store.fetchall(
+                "SELECT path, category, size_bytes, content_hash, phash FROM resources ORDER BY path"
+            )
+        ]
+
+    def _compute(self, rows: List[Dict[str, Any]], threshold: int) -> _Clusters:
+        parent = list(range(len(rows)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(a: int, b: int) -> None:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+        # Perceptual matches
+        hashed = [i for i, row in enumerate(rows) if row["phash"]]
+        if hashed:
+            hashes = np.array([phash_to_int(rows[i]["phash"]) for i in hashed], dtype=np.uint64)
+            for start in range(0, len(hashes), _CHUNK_SIZE):
+                block = np.bitwise_count(np.bitwise_xor(hashes[start:start + _CHUNK_SIZE, None], hashes[None, :]))
+                for a, b in zip(*np.nonzero(block <= threshold)):
+                    a += start
+                    if a < b:
+                        union(hashed[a], hashed[b])
+
+        # Byte-identical files (covers formats without a phash)
+        by_content = defaultdict(list)
+        for i, row in enumerate(rows):
+            by_content[row["content_hash"]].append(i)
+        for same in by_content.values():
+            for other in same[1:]:
+                union(same[0], other)
+
+        groups = defaultdict(list)
+        for i in range(len(rows)):
+            groups[find(i)].append(rows[i]["path"])
+
+        members, cluster_of = {}, {}
+        for paths in groups.values():
+            if len(paths) < 2:
+                continue
+            paths.sort(key=canonical_sort_key)
+            members[paths[0]] = paths
+            for path in paths:
+                cluster_of[path] = paths[0]
+        return _Clusters(members, cluster_of, {row["path"]: row for row in rows})
+
+    def clusters(self, threshold: Optional[int] = None) -> _Clusters:
+        threshold = self.threshold if threshold is None else threshold
+        version = self.index.version
+        with self._lock:
+            cached = self._cache.get(threshold)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+        clusters = self._compute(self._rows(), threshold)
+        with self._lock:
+            self._cache[threshold] = (version, clusters)
+        return clusters
+
+    def report(self, threshold: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Duplicate clusters with per-member distance to the representative
+        and the bytes that deleting the extra copies would free.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        clusters = self.clusters(threshold)
+        # Same snapshot the clusters were built from, so a sync in between can't drop a member
+        rows = clusters.rows
+
+        report = []
+        total_reclaimable = 0
+        for representative, paths in clusters.members.items():
+            reference = rows[representative]
+            members = []
+            for path in paths:
+                row = rows[path]
+                distance = None
+                if row["phash"] and reference["phash"]:
+                    distance = int(np.bitwise_count(phash_to_int(row["phash"]) ^ phash_to_int(reference["phash"])))
+                members.append({
+                    "path": path,
+                    "category": row["category"],
+                    "size_bytes": row["size_bytes"],
+                    "distance": distance,
+                    "identical": row["content_hash"] == reference["content_hash"],
+                })
+            reclaimable = sum(member["size_bytes"] for member in members[1:])
+            total_reclaimable += reclaimable
+            report.append({
+                "representative": representative,
+                "members": members,
+                "reclaimable_bytes": reclaimable,
+            })
+
+        report.sort(key=lambda cluster: -cluster["reclaimable_bytes"])
+        return {
+            "threshold": threshold,
+            "total_clusters": len(report),
+            "duplicate_files": sum(len(cluster["members"]) - 1 for cluster in report),
+            "reclaimable_bytes": total_reclaimable,
+            "clusters": report,
+        }
+
+    def collapse(self, paths: List[str], threshold: Optional[int] = None) -> List[str]:
+        """
+        Keep one path per duplicate cluster (the most canonical one among
+        `paths`), preserving order. Paths that aren't indexed are kept.
+        """
+        clusters = self.clusters(threshold)
+        cluster_of = {path: clusters.cluster_of.get(os.path.normpath(path)) for path in paths}
+
+        chosen = {}
+        for path, cluster in cluster_of.items():
+            if cluster is None:
+                continue
+            current = chosen.get(cluster)
+            if current is None or canonical_sort_key(path) < canonical_sort_key(current):
+                chosen[cluster] = path
+
+        collapsed, seen = [], set()
+        for path in paths:
+            cluster = cluster_of[path]
+            if path not in seen and (cluster is None or chosen[cluster] == path):
+                collapsed.append(path)
+                seen.add(path)
+        return collapsed
+
+_duplicate_detector: Optional[DuplicateDetector] = None
+
+def get_duplicate_detector() -> DuplicateDetector:
+    """
+    Process-wide duplicate detector; RESOURCE_DUPLICATE_THRESHOLD is the
+    maximum phash bit distance (out of 64) for two resources to count as
+    duplicates.
+    """
+    global _duplicate_detector
+    if _duplicate_detector is None:
+        _duplicate_detector = DuplicateDetector(
+            index=get_resource_index(),
+            threshold=int(os.getenv("RESOURCE_DUPLICATE_THRESHOLD", "6")),
+        )
+    return _duplicate_detector
@@ -0,0 +1,397 @@
+import asyncio
+import base64
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import xxhash
+from dotenv import load_dotenv
+from PIL import Image
+
+from utils.images_utils import normalize_format
+from utils.resources import ResourceCatalog, get_resource_catalog
+from utils.sqlite_store import SQLiteStore
+from utils.workers import run_in_process
+
+load_dotenv()
+
+# Colors kept per resource, most frequent first
+DOMINANT_COLORS = 5
+
+# Levels per RGB channel in the color histogram (4 -> 64 bins)
+HISTOGRAM_LEVELS = 4
+HISTOGRAM_BINS = HISTOGRAM_LEVELS ** 3
+
+_PHASH_SIZE = 32
+_PHASH_BITS = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    path TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    format TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    aspect_ratio REAL,
+    size_bytes INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    phash TEXT,
+    dominant_colors TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_category ON resources (category, path);
+CREATE INDEX IF NOT EXISTS resources_format ON resources (format);
+CREATE INDEX IF NOT EXISTS resources_content_hash ON resources (content_hash);
+CREATE TABLE IF NOT EXISTS features (
+    path TEXT PRIMARY KEY,
+    histogram BLOB NOT NULL
+);
+"""
+
+_COLUMNS = (
+    "path", "category", "format", "width", "height", "aspect_ratio", "size_bytes",
+    "mtime_ns", "content_hash", "phash", "dominant_colors", "indexed_at",
+)
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    k = np.arange(size)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """
+    64-bit DCT perceptual hash as 16 hex chars: the low 8x8 frequencies of
+    a 32x32 grayscale thumbnail compared against their median.
+    """
+    gray = image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_PHASH_BITS, :_PHASH_BITS].flatten()
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """
+    RGB version of `image` with any transparency composited onto white.
+    """
+    if image.mode in ("RGBA", "LA", "P"):
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    return image.convert("RGB")
+
+
+def color_histogram(image: Image.Image) -> np.ndarray:
+    """
+    Normalized HISTOGRAM_BINS-bin RGB histogram of a 64x64 thumbnail.
+    """
+    pixels = np.asarray(_flatten(image).resize((64, 64)), dtype=np.uint16).reshape(-1, 3)
+    levels = pixels * HISTOGRAM_LEVELS // 256
+    bins = (levels[:, 0] * HISTOGRAM_LEVELS + levels[:, 1]) * HISTOGRAM_LEVELS + levels[:, 2]
+    counts = np.bincount(bins, minlength=HISTOGRAM_BINS).astype(np.float32)
+    return counts / counts.sum()
+
+
+def dominant_colors(image: Image.Image, count: int = DOMINANT_COLORS) -> List[str]:
+    """
+    Most frequent colors of a quantized thumbnail, as #rrggbb strings.
+    """
+    small = _flatten(image).resize((64, 64))
+    quantized = small.quantize(colors=count)
+    palette = quantized.getpalette()
+    colors = sorted(quantized.getcolors(), reverse=True)
+    return ["#%02x%02x%02x" % tuple(palette[index * 3:index * 3 + 3]) for _, index in colors]
+
+
+def compute_resource_metadata(path: str) -> Dict[str, Any]:
+    """
+    Dimensions, format, content hash, perceptual hash and dominant colors
+    of one file. CPU-bound: runs in the process pool.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    metadata = {
+        "format": normalize_format(Path(path).suffix),
+        "width": None,
+        "height": None,
+        "aspect_ratio": None,
+        "content_hash": xxhash.xxh3_128_hexdigest(data),
+        "phash": None,
+        "dominant_colors": [],
+        "histogram": np.zeros(HISTOGRAM_BINS, dtype=np.float32),
+    }
+    try:
+        with Image.open(path) as image:
+            image.load()
+            metadata["format"] = image.format.lower()
+            metadata["width"], metadata["height"] = image.size
+            metadata["aspect_ratio"] = round(image.width / image.height, 4)
+            metadata["phash"] = perceptual_hash(image)
+            metadata["dominant_colors"] = dominant_colors(image)
+            metadata["histogram"] = color_histogram(image)
+    except Exception:
+        # Vector or unsupported formats (svg) only get hash and size
+        pass
+    return metadata
+
+
+def encode_cursor(path: str) -> str:
+    return base64.urlsafe_b64encode(path.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class ResourceIndex:
+    """
+    Persistent metadata index of resources_content.
+
+    A background worker keeps it in sync with the resource catalog:
+    new or changed files (by mtime and size) are analysed in the process
+    pool, deleted files are dropped. Listings are served from SQLite with
+    filters and keyset (cursor) pagination.
+    """
+
+    def __init__(self, db_path: str, catalog: ResourceCatalog, interval_seconds: float, batch_size: int = 8):
+        self.store = SQLiteStore(db_path, _SCHEMA)
+        self.catalog = catalog
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._last_sync: Optional[float] = None
+        # Bumped whenever rows change, so derived data (duplicates) knows to recompute
+        self.version = 0
+        self._indexed = 0
+        self._failures = 0
+
+    async def start(self) -> None:
+        if self._worker is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    def request_sync(self) -> None:
+        """
+        Ask the worker to sync now instead of at the next interval.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"⚠️  Resource index sync failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _pending(self) -> tuple:
+        """
+        (files to (re)index as (path, category, stat), paths to delete)
+        """
+        # Rows without features (indexed before histograms existed) count as stale
+        indexed = {
+            row["path"]: (row["mtime_ns"], row["size_bytes"]) if row["has_features"] else None
+            for row in self.store.fetchall(
+                "SELECT r.path, r.mtime_ns, r.size_bytes, f.path IS NOT NULL AS has_features "
+                "FROM resources r LEFT JOIN features f ON f.path = r.path"
+            )
+        }
+        pending = []
+        seen = set()
+        for category, paths in self.catalog.get_all().items():
+            for path in paths:
+                stat_result = self.catalog.stat(path)
+                if stat_result is None:
+                    continue
+                seen.add(path)
+                if indexed.get(path) != (stat_result.st_mtime_ns, stat_result.st_size):
+                    pending.append((path, category, stat_result))
+        return pending, [path for path in indexed if path not in seen]
+
+    async def _index_one(self, path: str, category: str, stat_result: os.stat_result) -> Optional[Tuple[tuple, tuple]]:
+        try:
+            metadata = await run_in_process(compute_resource_metadata, path)
+        except Exception as e:
+            self._failures += 1
+            print(f"⚠️  Could not index {path}: {e}")
+            return None
+        row = (
+            path,
+            category,
+            metadata["format"],
+            metadata["width"],
+            metadata["height"],
+            metadata["aspect_ratio"],
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+            metadata["content_hash"],
+            metadata["phash"],
+            json.dumps(metadata["dominant_colors"]),
+            time.time(),
+        )
+        return row, (path, metadata["histogram"].astype(np.float32).tobytes())
+
+    async def sync(self) -> Dict[str, int]:
+        """
+        Bring the index up to date with the catalog.
+        """
+        pending, removed = await asyncio.to_thread(self._pending)
+        if removed:
+            for table in ("resources", "features"):
+                await asyncio.to_thread(
+                    self.store.executemany, f"DELETE FROM {table} WHERE path = ?", [(path,) for path in removed]
+                )
+
+        indexed = 0
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            results = await asyncio.gather(*(self._index_one(*item) for item in batch))
+            results = [result for result in results if result is not None]
+            if results:
+                await asyncio.to_thread(
+                    self.store.executemany,
+                    f"INSERT OR REPLACE INTO resources ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    [row for row, _ in results],
+                )
+                await asyncio.to_thread(
+                    self.store.executemany,
+                    "INSERT OR REPLACE INTO features (path, histogram) VALUES (?, ?)",
+                    [features for _, features in results],
+                )
+            indexed += len(results)
+
+        self._indexed += indexed
+        if indexed or removed:
+            self.version += 1
+        self._last_sync = time.time()
+        if indexed or removed:
+            print(f"🗂️  Resource index: {indexed} indexed, {len(removed)} removed")
+        return {"indexed": indexed, "removed": len(removed)}
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        image_format: Optional[str] = None,
+        min_aspect_ratio: Optional[float] = None,
+        max_aspect_ratio: Optional[float] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        clusters: Optional[Dict[str, Tuple[str, int]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Filtered page of resources ordered by path. `next_cursor` is None on
+        the last page.
+
+        `clusters` maps paths to (cluster id, rank in the cluster); only the
+        best-ranked member of each cluster that passes the filters is
+        listed, and that happens before pagination, so no page repeats a
+        cluster.
+        """
+        clauses, params = [], []
+        if category is not None:
+            clauses.append("category = ?")
+            params.append(category)
+        if image_format is not None:
+            clauses.append("format = ?")
+            params.append(normalize_format(image_format))
+        if min_aspect_ratio is not None:
+            clauses.append("aspect_ratio >= ?")
+            params.append(min_aspect_ratio)
+        if max_aspect_ratio is not None:
+            clauses.append("aspect_ratio <= ?")
+            params.append(max_aspect_ratio)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        if clusters is None:
+            sql = f"SELECT * FROM resources {where}"
+            if cursor is not None:
+                sql += f" {'AND' if where else 'WHERE'} path > ?"
+        else:
+            # Filters apply before picking each cluster's member; the cursor after
+            sql = f"""
+                WITH filtered AS (
+                    SELECT resources.*,
+                           COALESCE(json_extract(members.value, '$[0]'), resources.path) AS cluster,
+                           COALESCE(json_extract(members.value, '$[1]'), 0) AS cluster_rank
+                    FROM resources
+                    LEFT JOIN json_each(?) AS members ON members.key = resources.path
+                    {where}
+                ), ranked AS (
+                    SELECT *, ROW_NUMBER() OVER (PARTITION BY cluster ORDER BY cluster_rank) AS position
+                    FROM filtered
+                )
+                SELECT * FROM ranked WHERE position = 1
+            """
+            params.insert(0, json.dumps(clusters))
+            if cursor is not None:
+                sql += " AND path > ?"
+        if cursor is not None:
+            params.append(decode_cursor(cursor))
+
+        rows = self.store.fetchall(f"{sql} ORDER BY path LIMIT ?", (*params, limit + 1))
+        items = [_row_to_item(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]["path"]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self.store.fetchone("SELECT * FROM resources WHERE path = ?", (path,))
+        return _row_to_item(row) if row is not None else None
+
+    def get_stats(self) -> dict:
+        rows = self.store.fetchall("SELECT category, COUNT(*) AS count FROM resources GROUP BY category")
+        return {
+            "indexed": {row["category"]: row["count"] for row in rows},
+            "indexed_since_start": self._indexed,
+            "failures": self._failures,
+            "last_sync": self._last_sync,
+            "interval_seconds": self.interval_seconds,
+        }
+
+
+def _row_to_item(row) -> Dict[str, Any]:
+    item = {column: row[column] for column in _COLUMNS if column not in ("mtime_ns", "indexed_at")}
+    item["dominant_colors"] = json.loads(row["dominant_colors"])
+    return item
+
+
+_resource_index: Optional[ResourceIndex] = None
+
+def get_resource_index() -> ResourceIndex:
+    """
+    Process-wide resource metadata index, configured through
+    RESOURCE_INDEX_DB and RESOURCE_INDEX_INTERVAL_SECONDS.
+    """
+    global _resource_index
+    if _resource_index is None:
+        _resource_index = ResourceIndex(
+            db_path=os.getenv("RESOURCE_INDEX_DB", "data/resource_index.sqlite3"),
+            catalog=get_resource_catalog(),
+            interval_seconds=float(os.getenv("RESOURCE_INDEX_INTERVAL_SECONDS", "30")),
+        )
+    return _resource_index
@@ -0,0 +1,299 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import xxhash
+from dotenv import load_dotenv
+
+from services.resource_index import HISTOGRAM_BINS, HISTOGRAM_LEVELS, ResourceIndex, get_resource_index
+
+load_dotenv()
+
+# Dimensions of the hashed bag-of-words keyword vectors
+KEYWORD_DIMS = 512
+
+# Named colors recognized in descriptions (Spanish and English) and used to
+# describe resources by their dominant colors
+COLOR_NAMES = {
+    "rojo": (220, 30, 40), "red": (220, 30, 40),
+    "naranja": (245, 130, 30), "orange": (245, 130, 30),
+    "amarillo": (250, 215, 40), "yellow": (250, 215, 40),
+    "verde": (40, 160, 70), "green": (40, 160, 70),
+    "azul": (30, 80, 200), "blue": (30, 80, 200),
+    "celeste": (110, 190, 240), "cyan": (110, 190, 240),
+    "morado": (120, 50, 160), "violeta": (120, 50, 160), "purple": (120, 50, 160),
+    "rosa": (240, 120, 180), "pink": (240, 120, 180),
+    "marron": (120, 75, 40), "brown": (120, 75, 40),
+    "negro": (20, 20, 20), "black": (20, 20, 20),
+    "blanco": (245, 245, 245), "white": (245, 245, 245),
+    "gris": (128, 128, 128), "gray": (128, 128, 128), "grey": (128, 128, 128),
+}
+
+# Words that point at each resource category
+CATEGORY_KEYWORDS = {
+    "avatars": ["avatar", "persona", "personaje", "mascota", "person", "character", "mascot", "cara", "face"],
+    "elements": ["elemento", "logo", "icono", "sticker", "grafico", "element", "icon", "graphic"],
+    "templates": ["plantilla", "template", "fondo", "marco", "layout", "background", "frame"],
+    "images": ["imagen", "foto", "fotografia", "image", "photo", "picture"],
+}
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "this", "that", "una", "uno", "unos", "unas", "los", "las",
+    "del", "con", "para", "por", "que", "como", "sus", "sobre", "entre", "est", "esta", "este",
+    "medium", "copy",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased, accent-free word tokens, without stopwords or id-like
+    fragments (anything containing digits).
+    """
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    return [
+        token for token in _TOKEN.findall(text)
+        if len(token) >= 3 and token not in _STOPWORDS and not any(c.isdigit() for c in token)
+    ]
+
+
+def keyword_vector(tokens: List[str]) -> np.ndarray:
+    """
+    L2-normalized hashed bag-of-words vector.
+    """
+    vector = np.zeros(KEYWORD_DIMS, dtype=np.float32)
+    for token, count in Counter(tokens).items():
+        vector[xxhash.xxh32_intdigest(token.encode("utf-8")) % KEYWORD_DIMS] += count
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def parse_color(color: str) -> Optional[tuple]:
+    """
+    (r, g, b) from "#rrggbb", "rrggbb" or a color name.
+    """
+    color = color.strip().lower()
+    if color in COLOR_NAMES:
+        return COLOR_NAMES[color]
+    hex_value = color.lstrip("#")
+    if re.fullmatch(r"[0-9a-f]{6}", hex_value):
+        return tuple(int(hex_value[i:i + 2], 16) for i in (0, 2, 4))
+    return None
+
+
+def nearest_color_names(rgb: tuple) -> List[str]:
+    """
+    Names (in every language) of the named color closest to `rgb`.
+    """
+    distances = {name: sum((a - b) ** 2 for a, b in zip(rgb, value)) for name, value in COLOR_NAMES.items()}
+    closest = COLOR_NAMES[min(distances, key=distances.get)]
+    return [name for name, value in COLOR_NAMES.items() if value == closest]
+
+
+def color_query_histogram(colors: List[tuple]) -> np.ndarray:
+    histogram = np.zeros(HISTOGRAM_BINS, dtype=np.float32)
+    for r, g, b in colors:
+        levels = [channel * HISTOGRAM_LEVELS // 256 for channel in (r, g, b)]
+        histogram[(levels[0] * HISTOGRAM_LEVELS + levels[1]) * HISTOGRAM_LEVELS + levels[2]] += 1
+    return histogram / histogram.sum() if histogram.sum() else histogram
+
+
+def resource_keywords(row: Dict[str, Any]) -> List[str]:
+    """
+    Keywords describing an indexed resource: its category, words from its
+    filename, the names of its dominant colors and its orientation.
+    """
+    keywords = list(CATEGORY_KEYWORDS.get(row["category"], []))
+    keywords += tokenize(Path(row["path"]).stem.replace("_", " "))
+    for color in row["dominant_colors"][:3]:
+        keywords += nearest_color_names(parse_color(color))
+    aspect_ratio = row["aspect_ratio"]
+    if aspect_ratio:
+        if aspect_ratio > 1.2:
+            keywords += ["horizontal", "landscape", "banner"]
+        elif aspect_ratio < 0.83:
+            keywords += ["vertical", "portrait", "historia", "story"]
+        else:
+            keywords += ["cuadrado", "square"]
+    return keywords
+
+
+class _FeatureMatrix:
+    def __init__(
+        self,
+        paths: List[str],
+        categories: List[str],
+        histograms: np.ndarray,
+        keywords: np.ndarray,
+        phashes: np.ndarray,
+    ):
+        self.paths = paths
+        self.categories = np.array(categories)
+        self.position = {path: i for i, path in enumerate(paths)}
+        # (n, HISTOGRAM_BINS) normalized color histograms
+        self.histograms = histograms
+        # (n, KEYWORD_DIMS) L2-normalized keyword vectors
+        self.keywords = keywords
+        # (n,) 64-bit perceptual hashes (0 when the format has none)
+        self.phashes = phashes
+
+
+class ResourceSearch:
+    """
+    Local similarity search over the indexed resources.
+
+    Every resource becomes a row of NumPy matrices (color histogram, hashed
+    keyword vector, perceptual hash), rebuilt whenever the index changes.
+    A query (free text such as a day's description, brand colors and/or an
+    example resource) is scored against all rows at once and the top k are
+    returned, so planners can be handed a fixed number of candidates
+    however large the catalog grows.
+    """
+
+    def __init__(self, index: ResourceIndex, default_k: int):
+        self.index = index
+        self.default_k = default_k
+        self._matrix: Optional[_FeatureMatrix] = None
+        self._version = -1
+        self._lock = threading.Lock()
+
+    def _load(self) -> _FeatureMatrix:
+        with self._lock:
+            if self._matrix is not None and self._version == self.index.version:
+                return self._matrix
+            version = self.index.version
+
+        rows = self.index.store.fetchall(
+            "SELECT r.path, r.category, r.aspect_ratio, r.dominant_colors, r.phash, f.histogram "
+            "FROM resources r JOIN features f ON f.path = r.path ORDER BY r.path"
+        )
+        paths, categories, histograms, keywords, phashes = [], [], [], [], []
+        for row in rows:
+            item = dict(row)
+            item["dominant_colors"] = json.loads(item["dominant_colors"])
+            paths.append(item["path"])
+            categories.append(item["category"])
+            histograms.append(np.frombuffer(item["histogram"], dtype=np.float32))
+            keywords.append(keyword_vector(resource_keywords(item)))
+            phashes.append(int(item["phash"], 16) if item["phash"] else 0)
+
+        matrix = _FeatureMatrix(
+            paths,
+            categories,
+            np.vstack(histograms) if histograms else np.zeros((0, HISTOGRAM_BINS), dtype=np.float32),
+            np.vstack(keywords) if keywords else np.zeros((0, KEYWORD_DIMS), dtype=np.float32),
+            np.array(phashes, dtype=np.uint64),
+        )
+        with self._lock:
+            self._matrix, self._version = matrix, version
+        return matrix
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        colors: Optional[List[str]] = None,
+        category: Optional[str] = None,
+        k: Optional[int] = None,
+        candidates: Optional[List[str]] = None,
+        similar_to: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k resources for a text query, brand colors and/or an example
+        resource (`similar_to`, compared by phash and colors).
+
+        `candidates` narrows the search to those paths (as given by the
+        caller; unindexed ones are ranked last); `category` and the
+        exclusion of `similar_to` still apply. Color words in `query`
+        ("fondo azul") count as colors too.
+        """
+        k = self.default_k if k is None else k
+        matrix = self._load()
+
+        tokens = tokenize(query or "")
+        query_colors = [parse_color(color) for color in colors or []]
+        query_colors += [COLOR_NAMES[token] for token in tokens if token in COLOR_NAMES]
+        query_colors = [color for color in query_colors if color is not None]
+
+        scores = np.zeros(len(matrix.paths), dtype=np.float32)
+        weights = 0.0
+        if tokens:
+            scores += matrix.keywords @ keyword_vector(tokens)
+            weights += 1.0
+        if query_colors:
+            # Histogram intersection: share of each resource's pixels in the query colors
+            scores += np.minimum(matrix.histograms, color_query_histogram(query_colors)).sum(axis=1)
+            weights += 1.0
+        example = matrix.position.get(os.path.normpath(similar_to)) if similar_to else None
+        if similar_to and example is None:
+            raise ValueError(f"Resource not indexed: {similar_to}")
+        if example is not None:
+            distances = np.bitwise_count(np.bitwise_xor(matrix.phashes, matrix.phashes[example]))
+            visual = 1.0 - distances.astype(np.float32) / 64
+            colors_alike = np.minimum(matrix.histograms, matrix.histograms[example]).sum(axis=1)
+            scores += (visual + colors_alike) / 2
+            weights += 1.0
+        if weights:
+            scores /= weights
+
+        mask = np.ones(len(matrix.paths), dtype=bool)
+        if category is not None:
+            mask &= matrix.categories == category
+        if example is not None:
+            mask[example] = False
+
+        unindexed = []
+        requested = {}
+        if candidates is not None:
+            candidate_mask = np.zeros(len(matrix.paths), dtype=bool)
+            for path in candidates:
+                position = matrix.position.get(os.path.normpath(path))
+                if position is None:
+                    # Category of an unindexed file is only known from its folder
+                    if category is None or Path(path).parent.name == category:
+                        unindexed.append(path)
+                else:
+                    candidate_mask[position] = True
+                    requested[position] = path
+            # On top of the category filter and the example's exclusion
+            mask &= candidate_mask
+
+        eligible = np.flatnonzero(mask)
+        if len(eligible) > k:
+            top = eligible[np.argpartition(-scores[eligible], k - 1)[:k]]
+        else:
+            top = eligible
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results = [
+            {
+                "path": requested.get(position, matrix.paths[position]),
+                "category": str(matrix.categories[position]),
+                "score": round(float(scores[position]), 4),
+            }
+            for position in top
+        ]
+        for path in unindexed[:max(0, k - len(results))]:
+            results.append({"path": path, "category": None, "score": None})
+        return results
+
+
+_resource_search: Optional[ResourceSearch] = None
+
+def get_resource_search() -> ResourceSearch:
+    """
+    Process-wide resource search; PLANNER_RESOURCE_CANDIDATES is the default k.
+    """
+    global _resource_search
+    if _resource_search is None:
+        _resource_search = ResourceSearch(
+            index=get_resource_index(),
+            default_k=int(os.getenv("PLANNER_RESOURCE_CANDIDATES", "12")),
+        )
+    return _resource_search
@@ -0,0 +1,297 @@
+import asyncio
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import xxhash
+from dotenv import load_dotenv
+from PIL import Image
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from services.derivatives import DerivativeService, get_derivative_service, public_url
+from services.reference_normalizer import ReferenceNormalizer, get_reference_normalizer
+from services.resource_index import ResourceIndex, get_resource_index
+from utils.resources import IMAGE_EXTENSIONS, RESOURCE_CATEGORIES, ResourceCatalog, get_resource_catalog
+
+load_dotenv()
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._ ()-]+")
+
+# SVGs can carry scripts and would be served inline from the API origin,
+# so only raster formats are accepted
+UPLOAD_EXTENSIONS = IMAGE_EXTENSIONS - {".svg"}
+
+
+class UploadError(ValueError):
+    pass
+
+
+def safe_filename(filename: str) -> str:
+    """
+    Basename of a client-supplied filename with anything outside a
+    conservative character set replaced.
+    """
+    name = _UNSAFE_FILENAME_CHARS.sub("_", Path(filename.replace("\\", "/")).name).strip(" .")
+    if not name or Path(name).suffix.lower() not in UPLOAD_EXTENSIONS:
+        raise UploadError(f"Unsupported file type: {filename or '(no name)'}")
+    return name
+
+
+def verify_image(path: str) -> None:
+    """
+    Check the file really is a readable image.
+    """
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        raise UploadError("Not a readable image")
+
+
+class _IncomingFile:
+    def __init__(self, filename: str, tmp_path: Path):
+        self.filename = filename
+        self.tmp_path = tmp_path
+        self.handle = open(tmp_path, "wb")
+        self.hasher = xxhash.xxh3_128()
+        self.size = 0
+        self.error: Optional[str] = None
+
+    def write(self, chunks: List[bytes]) -> None:
+        for chunk in chunks:
+            self.handle.write(chunk)
+            self.hasher.update(chunk)
+            self.size += len(chunk)
+
+    def close(self) -> None:
+        if not self.handle.closed:
+            self.handle.close()
+
+    def discard(self) -> None:
+        self.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class ResourceUploadService:
+    """
+    Streams multipart uploads straight into resources_content/<category>.
+
+    File parts are written to disk chunk by chunk as they arrive (never
+    held in memory whole) and hashed while writing. While the next part is
+    still being received, finished parts are checked concurrently:
+    rejected if they duplicate an existing resource or another file of the
+    same request, verified as images, then moved into place. New files are
+    handed to the derivative builder, the reference normalizer and the
+    metadata index in the background.
+    """
+
+    def __init__(
+        self,
+        catalog: ResourceCatalog,
+        index: ResourceIndex,
+        derivatives: DerivativeService,
+        normalizer: ReferenceNormalizer,
+        max_file_bytes: int,
+        max_files: int,
+    ):
+        self.catalog = catalog
+        self.index = index
+        self.derivatives = derivatives
+        self.normalizer = normalizer
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+
+    def _find_duplicate(self, content_hash: str) -> Optional[str]:
+        row = self.index.store.fetchone(
+            "SELECT path FROM resources WHERE content_hash = ? LIMIT 1", (content_hash,)
+        )
+        return row["path"] if row is not None else None
+
+    def _place(self, incoming: _IncomingFile, directory: Path, content_hash: str) -> str:
+        """
+        Move the finished temp file to its final name without overwriting
+        an existing resource.
+        """
+        target = directory / incoming.filename
+        if target.exists():
+            target = directory / f"{target.stem}_{content_hash[:8]}{target.suffix}"
+        os.link(incoming.tmp_path, target)
+        os.remove(incoming.tmp_path)
+        return str(target)
+
+    async def _finish(
+        self,
+        incoming: _IncomingFile,
+        directory: Path,
+        seen_hashes: Dict[str, str],
+    ) -> Dict[str, Any]:
+        result = {"filename": incoming.filename, "size_bytes": incoming.size}
+        if incoming.error is not None:
+            await asyncio.to_thread(incoming.discard)
+            return {**result, "status": "rejected", "error": incoming.error}
+
+        content_hash = incoming.hasher.hexdigest()
+        result["content_hash"] = content_hash
+
+        # Claim the hash synchronously so concurrent parts of this request see it
+        duplicate_of = seen_hashes.get(content_hash)
+        if duplicate_of is None:
+            seen_hashes[content_hash] = incoming.filename
+            duplicate_of = await asyncio.to_thread(self._find_duplicate, content_hash)
+        if duplicate_of is not None:
+            await asyncio.to_thread(incoming.discard)
+            return {**result, "status": "duplicate", "duplicate_of": duplicate_of}
+
+        try:
+            await asyncio.to_thread(verify_image, str(incoming.tmp_path))
+            path = await asyncio.to_thread(self._place, incoming, directory, content_hash)
+        except Exception as e:
+            seen_hashes.pop(content_hash, None)
+            await asyncio.to_thread(incoming.discard)
+            return {**result, "status": "rejected", "error": str(e)}
+
+        self.derivatives.schedule(path)
+        self.normalizer.schedule(path)
+        return {**result, "status": "created", "path": path, "url": public_url(path)}
+
+    async def ingest(self, category: str, content_type: str, stream: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Consume a multipart/form-data request body and store every file part
+        in `category`. Non-file fields are ignored.
+        """
+        if category not in RESOURCE_CATEGORIES:
+            raise UploadError(f"Unknown resource category: {category}")
+        content_kind, options = parse_options_header(content_type)
+        if content_kind != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadError("Expected a multipart/form-data body")
+
+        directory = self.catalog.root / category
+        directory.mkdir(parents=True, exist_ok=True)
+
+        # Parser callbacks are synchronous; they only record what happened and
+        # the events are applied (with file I/O off the loop) after each chunk
+        events: List[tuple] = []
+        header = {"name": b"", "value": b""}
+        part_headers: Dict[bytes, bytes] = {}
+
+        def on_header_field(data: bytes, start: int, end: int) -> None:
+            header["name"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int) -> None:
+            header["value"] += data[start:end]
+
+        def on_header_end() -> None:
+            part_headers[header["name"].lower()] = header["value"]
+            header["name"], header["value"] = b"", b""
+
+        def on_headers_finished() -> None:
+            _, disposition = parse_options_header(part_headers.get(b"content-disposition", b""))
+            part_headers.clear()
+            filename = disposition.get(b"filename")
+            events.append(("begin", filename.decode("utf-8", "replace") if filename is not None else None))
+
+        def on_part_data(data: bytes, start: int, end: int) -> None:
+            events.append(("data", data[start:end]))
+
+        def on_part_end() -> None:
+            events.append(("end", None))
+
+        parser = MultipartParser(options[b"boundary"], {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+
+        seen_hashes: Dict[str, str] = {}
+        finishing: List[asyncio.Task] = []
+        current: Optional[_IncomingFile] = None
+        is_file_part = False
+        file_count = 0
+
+        try:
+            async for chunk in stream:
+                parser.write(chunk)
+                pending_data: List[bytes] = []
+                for kind, value in events:
+                    if kind == "begin":
+                        is_file_part = value is not None
+                        if not is_file_part:
+                            continue
+                        file_count += 1
+                        if file_count > self.max_files:
+                            raise UploadError(f"Too many files; the limit is {self.max_files} per request")
+                        tmp_path = directory / f".upload-{uuid.uuid4().hex}.part"
+                        current = await asyncio.to_thread(_IncomingFile, "", tmp_path)
+                        try:
+                            current.filename = safe_filename(value)
+                        except UploadError as e:
+                            current.filename = value
+                            current.error = str(e)
+                    elif kind == "data" and current is not None and is_file_part and current.error is None:
+                        pending_data.append(value)
+                        if current.size + sum(map(len, pending_data)) > self.max_file_bytes:
+                            current.error = f"File exceeds {self.max_file_bytes // (1024 * 1024)} MB"
+                            pending_data = []
+                    elif kind == "end" and current is not None and is_file_part:
+                        if pending_data:
+                            await asyncio.to_thread(current.write, pending_data)
+                            pending_data = []
+                        await asyncio.to_thread(current.close)
+                        finishing.append(asyncio.create_task(self._finish(current, directory, seen_hashes)))
+                        current = None
+                if pending_data and current is not None:
+                    await asyncio.to_thread(current.write, pending_data)
+                events.clear()
+            parser.finalize()
+        except BaseException:
+            if current is not None:
+                await asyncio.to_thread(current.discard)
+            for task in finishing:
+                task.cancel()
+            raise
+
+        if current is not None:
+            # Body ended in the middle of a part
+            await asyncio.to_thread(current.discard)
+
+        files = list(await asyncio.gather(*finishing))
+        created = [f for f in files if f["status"] == "created"]
+        if created:
+            self.catalog.invalidate()
+            self.index.request_sync()
+
+        return {
+            "category": category,
+            "uploaded": len(created),
+            "duplicates": sum(1 for f in files if f["status"] == "duplicate"),
+            "rejected": sum(1 for f in files if f["status"] == "rejected"),
+            "files": files,
+        }
+
+
+_resource_upload_service: Optional[ResourceUploadService] = None
+
+def get_resource_upload_service() -> ResourceUploadService:
+    """
+    Process-wide upload service, limited by RESOURCE_UPLOAD_MAX_MB per file
+    and RESOURCE_UPLOAD_MAX_FILES per request.
+    """
+    global _resource_upload_service
+    if _resource_upload_service is None:
+        _resource_upload_service = ResourceUploadService(
+            catalog=get_resource_catalog(),
+            index=get_resource_index(),
+            derivatives=get_derivative_service(),
+            normalizer=get_reference_normalizer(),
+            max_file_bytes=int(float(os.getenv("RESOURCE_UPLOAD_MAX_MB", "25")) * 1024 * 1024),
+            max_files=int(os.getenv("RESOURCE_UPLOAD_MAX_FILES", "50")),
+        )
+    return _resource_upload_service
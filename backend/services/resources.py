@@ -1,22 +1,41 @@
-from utils.resources import get_templates, get_elements, get_avatars, get_images
+from typing import Dict, List, Optional
+
+from utils.resources import get_resource_catalog, ResourceCatalog
 
 
 class ResourcesService:
-    def __init__(self):
-        pass
+    def __init__(self, catalog: ResourceCatalog):
+        self.catalog = catalog
 
     def get_templates(self):
-        return get_templates()
+        return self.catalog.get("templates")
 
     def get_elements(self):
-        return get_elements()
+        return self.catalog.get("elements")
     
     def get_avatars(self):
-        return get_avatars()
+        return self.catalog.get("avatars")
     
     def get_images(self):
-        return get_images()
+        return self.catalog.get("images")
+
+    def get_category(self, category: str) -> List[str]:
+        return self.catalog.get(category)
+
+    def get_all_resources(self) -> Dict[str, List[str]]:
+        return self.catalog.get_all()
+
+    def refresh(self) -> Dict[str, int]:
+        return self.catalog.refresh()
+
+    def get_stats(self) -> dict:
+        return self.catalog.get_stats()
     
 
+_resources_service: Optional[ResourcesService] = None
+
 def get_resources_service() -> ResourcesService:
-    return ResourcesService()
\ No newline at end of file
+    global _resources_service
+    if _resources_service is None:
+        _resources_service = ResourcesService(get_resource_catalog())
+    return _resources_service
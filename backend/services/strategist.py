@@ -5,6 +5,7 @@ from openai import OpenAI
 from pydantic import BaseModel
 from enum import Enum
 from dotenv import load_dotenv
+from services.chat_completions import get_chat_completion_client
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -31,24 +32,10 @@ class StrategistService:
             Diccionario con la estrategia mensual y contexto de marca
         """
         
-        # Construir el prompt para el agente strategist
-        prompt = self._build_strategist_prompt(company_info, campaign_focus, month_name)
-        
         try:
             # Llamar a OpenAI
             response = self.client.chat.completions.create(
-                model="o3",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un estratega de marketing digital senior con 15+ años de experiencia. Te especializas en crear estrategias mensuales coherentes y ejecutables basadas en el análisis profundo de marcas, audiencias y mercados. Generas respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                response_format={"type": "json_object"}
+                **self._build_request(company_info, campaign_focus, month_name)
             )
             
             # Parsear la respuesta
@@ -60,6 +47,57 @@ class StrategistService:
         except Exception as e:
             raise Exception(f"Error al generar la estrategia mensual: {str(e)}")
     
+    async def generate_monthly_strategy_async(
+        self,
+        company_info: str,
+        campaign_focus: Optional[str] = None,
+        month_name: Optional[str] = None,
+        cache: str = "reuse"
+    ) -> Dict[str, Any]:
+        """
+        Igual que generate_monthly_strategy, pero con el cliente AsyncOpenAI
+        compartido: la llamada a o3 no bloquea el event loop. Una petición
+        idéntica reciente se responde desde la caché de respuestas según
+        `cache` ("reuse", "refresh" o "bypass").
+        """
+        try:
+            content = await get_chat_completion_client().create(
+                cache=cache,
+                **self._build_request(company_info, campaign_focus, month_name)
+            )
+            return json.loads(content)
+            
+        except Exception as e:
+            raise Exception(f"Error al generar la estrategia mensual: {str(e)}")
+    
+    def _build_request(
+        self,
+        company_info: str,
+        campaign_focus: Optional[str] = None,
+        month_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Parámetros de la llamada a chat.completions del agente strategist.
+        """
+        
+        # Construir el prompt para el agente strategist
+        prompt = self._build_strategist_prompt(company_info, campaign_focus, month_name)
+        
+        return dict(
+            model="o3",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Eres un estratega de marketing digital senior con 15+ años de experiencia. Te especializas en crear estrategias mensuales coherentes y ejecutables basadas en el análisis profundo de marcas, audiencias y mercados. Generas respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            response_format={"type": "json_object"}
+        )
+    
     def _build_strategist_prompt(
         self,
         company_info: str,
@@ -0,0 +1,279 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity or rate_per_minute
+        self.fill_rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.fill_rate)
+        self.updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        """Seconds until `amount` tokens can be consumed (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.fill_rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def set_rate(self, rate_per_minute: float) -> None:
+        self._refill()
+        self.fill_rate = rate_per_minute / 60.0
+
+
+class UpstreamScheduler:
+    """
+    Process-wide admission control for upstream OpenAI calls.
+
+    Every call waits in a FIFO queue until a concurrency slot is free and the
+    requests-per-minute / units-per-minute buckets allow it. Rate-limit
+    responses pause the whole queue for their Retry-After and temporarily
+    slow the request bucket down; successful calls restore it gradually.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        units_per_minute: Optional[float] = None,
+        max_concurrency: int = 10,
+        max_batch_size: int = 10,
+        max_retries: int = 3,
+    ):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.units_per_minute = units_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._unit_bucket = TokenBucket(units_per_minute) if units_per_minute else None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # asyncio.Lock wakes waiters in FIFO order, so holding it while waiting
+        # for capacity turns it into the admission queue.
+        self._admission = asyncio.Lock()
+        self._paused_until = 0.0
+
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._in_flight = 0
+        self._total_calls = 0
+        self._total_rate_limited = 0
+        self._total_retries = 0
+        self._total_failed = 0
+        self._total_wait_seconds = 0.0
+
+    async def run(self, call: Callable[[], Awaitable[T]], units: int = 1) -> T:
+        """
+        Run `call` once admitted, retrying rate limits and transient errors.
+
+        Args:
+            call: Zero-argument coroutine factory performing the upstream call
+            units: Units consumed from the per-minute unit bucket (e.g. images)
+        """
+        attempt = 0
+        while True:
+            await self._acquire(units)
+            backoff = 0.0
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    self._total_failed += 1
+                    raise
+                attempt += 1
+                self._total_retries += 1
+                # Rate limits pause the whole queue through _paused_until;
+                # other transient errors only back off this call
+                if not isinstance(e, openai.RateLimitError):
+                    backoff = delay
+                print(f"⏳ [{self.name}] upstream throttled, retrying in {delay:.1f}s (attempt {attempt})")
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release()
+            # Outside the slot, so the backoff doesn't hold back other calls
+            await asyncio.sleep(backoff)
+
+    async def _acquire(self, units: int) -> None:
+        self._queue_depth += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        queued_at = time.monotonic()
+        try:
+            async with self._admission:
+                await self._semaphore.acquire()
+                try:
+                    while True:
+                        delay = self._time_until_admitted(units)
+                        if delay <= 0:
+                            break
+                        await asyncio.sleep(delay)
+                except BaseException:
+                    self._semaphore.release()
+                    raise
+                if self._request_bucket:
+                    self._request_bucket.consume(1)
+                if self._unit_bucket:
+                    self._unit_bucket.consume(units)
+        finally:
+            self._queue_depth -= 1
+        self._in_flight += 1
+        self._total_calls += 1
+        self._total_wait_seconds += time.monotonic() - queued_at
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    def _time_until_admitted(self, units: int) -> float:
+        delay = self._paused_until - time.monotonic()
+        if self._request_bucket:
+            delay = max(delay, self._request_bucket.time_until_available(1))
+        if self._unit_bucket:
+            delay = max(delay, self._unit_bucket.time_until_available(units))
+        return delay
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying `error`, or None if it is not retryable.
+        """
+        backoff = min(60.0, 2 ** attempt) + random.uniform(0, 0.5)
+
+        if isinstance(error, openai.RateLimitError):
+            self._total_rate_limited += 1
+            retry_after = _retry_after_seconds(error) or backoff
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if self._request_bucket and self.requests_per_minute:
+                # Halve the pace, never below 10% of the configured limit
+                slowed = max(self.requests_per_minute * 0.1, self._request_bucket.fill_rate * 60.0 / 2)
+                self._request_bucket.set_rate(slowed)
+            return retry_after
+
+        if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+            return backoff
+
+        return None
+
+    def _on_success(self) -> None:
+        if self._request_bucket and self.requests_per_minute:
+            current = self._request_bucket.fill_rate * 60.0
+            if current < self.requests_per_minute:
+                self._request_bucket.set_rate(min(self.requests_per_minute, current + self.requests_per_minute * 0.1))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of queue-depth and throughput metrics.
+        """
+        return {
+            "name": self.name,
+            "queue_depth": self._queue_depth,
+            "max_queue_depth": self._max_queue_depth,
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "max_batch_size": self.max_batch_size,
+            "requests_per_minute": self.requests_per_minute,
+            "units_per_minute": self.units_per_minute,
+            "effective_requests_per_minute": (
+                round(self._request_bucket.fill_rate * 60.0, 2) if self._request_bucket else None
+            ),
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "total_calls": self._total_calls,
+            "total_rate_limited": self._total_rate_limited,
+            "total_retries": self._total_retries,
+            "total_failed": self._total_failed,
+            "average_wait_seconds": (
+                round(self._total_wait_seconds / self._total_calls, 3) if self._total_calls else 0.0
+            ),
+        }
+
+
+def _retry_after_seconds(error: openai.APIStatusError) -> Optional[float]:
+    """
+    Read `retry-after-ms` / `retry-after` from a rate-limit response.
+    """
+    headers = error.response.headers if error.response is not None else {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return float(value) or None
+
+
+_image_scheduler: Optional[UpstreamScheduler] = None
+
+def get_image_scheduler() -> UpstreamScheduler:
+    """
+    Shared scheduler for every gpt-image-1 call in the process.
+
+    Configured through IMAGE_RPM_LIMIT, IMAGE_IPM_LIMIT, IMAGE_MAX_CONCURRENCY,
+    IMAGE_MAX_BATCH_SIZE and IMAGE_MAX_RETRIES (0 disables a rate limit).
+    """
+    global _image_scheduler
+    if _image_scheduler is None:
+        _image_scheduler = UpstreamScheduler(
+            name="gpt-image-1",
+            requests_per_minute=_env_float("IMAGE_RPM_LIMIT", 50),
+            units_per_minute=_env_float("IMAGE_IPM_LIMIT", 50),
+            max_concurrency=int(os.getenv("IMAGE_MAX_CONCURRENCY", "10")),
+            max_batch_size=int(os.getenv("IMAGE_MAX_BATCH_SIZE", "10")),
+            max_retries=int(os.getenv("IMAGE_MAX_RETRIES", "3")),
+        )
+    return _image_scheduler
+
+
+_chat_scheduler: Optional[UpstreamScheduler] = None
+
+def get_chat_scheduler() -> UpstreamScheduler:
+    """
+    Shared scheduler for the chat completion calls of the planning services.
+
+    Configured through CHAT_RPM_LIMIT, CHAT_MAX_CONCURRENCY and
+    CHAT_MAX_RETRIES (0 disables the rate limit).
+    """
+    global _chat_scheduler
+    if _chat_scheduler is None:
+        _chat_scheduler = UpstreamScheduler(
+            name="chat",
+            requests_per_minute=_env_float("CHAT_RPM_LIMIT", 500),
+            max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "20")),
+            max_retries=int(os.getenv("CHAT_MAX_RETRIES", "3")),
+        )
+    return _chat_scheduler
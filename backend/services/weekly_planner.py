@@ -1,14 +1,22 @@
+import asyncio
 import json
 import os
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, Callable
 from openai import OpenAI
 from pydantic import BaseModel
 from enum import Enum
 from dotenv import load_dotenv
+from services.chat_completions import get_chat_completion_client
+from services.resource_search import get_resource_search
+from utils.resources import ResourceValidation, get_resource_catalog
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+# Semanas generadas a la vez por petición y tiempo máximo por semana
+PLANNER_MAX_CONCURRENT_WEEKS = int(os.getenv("PLANNER_MAX_CONCURRENT_WEEKS", "4"))
+PLANNER_WEEK_TIMEOUT_SECONDS = float(os.getenv("PLANNER_WEEK_TIMEOUT_SECONDS", "180"))
+
 class WeekDay(str, Enum):
     MONDAY = "lunes"
     TUESDAY = "martes"
@@ -53,26 +61,10 @@ class WeeklyPlannerService:
             Diccionario con la planificación por día de la semana
         """
         
-        # Construir el prompt para el agente de OpenAI
-        prompt = self._build_prompt(high_level_planning, resources_paths, brand_context)
-        
         try:
             # Llamar a OpenAI
             response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Eres un community manager experto especializado en crear planificaciones semanales para redes sociales. Debes generar respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                response_format={"type": "json_object"}
+                **self._build_request(high_level_planning, resources_paths, brand_context)
             )
             
             # Parsear la respuesta
@@ -84,6 +76,139 @@ class WeeklyPlannerService:
         except Exception as e:
             raise Exception(f"Error al generar el plan semanal: {str(e)}")
     
+    async def generate_weekly_plan_async(
+        self,
+        high_level_planning: str,
+        resources_paths: List[str],
+        brand_context: Optional[str] = None,
+        cache: str = "reuse"
+    ) -> Dict[str, Any]:
+        """
+        Igual que generate_weekly_plan, pero con el cliente AsyncOpenAI
+        compartido: la llamada no bloquea el event loop. `cache` ("reuse",
+        "refresh" o "bypass") controla la caché de respuestas.
+        """
+        try:
+            content = await get_chat_completion_client().create(
+                cache=cache,
+                **self._build_request(high_level_planning, resources_paths, brand_context)
+            )
+            return json.loads(content)
+            
+        except Exception as e:
+            raise Exception(f"Error al generar el plan semanal: {str(e)}")
+    
+    async def generate_weekly_plans_async(
+        self,
+        weeks: Dict[str, Dict[str, Any]],
+        resources_paths: List[str],
+        brand_context: Optional[str] = None,
+        brand_colors: Optional[List[str]] = None,
+        max_resources: Optional[int] = None,
+        max_concurrent_weeks: Optional[int] = None,
+        week_timeout: Optional[float] = None,
+        on_week: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        cache: str = "reuse"
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Genera en paralelo el plan semanal de cada semana de un plan mensual.
+        Una semana que falla o supera `week_timeout` queda con "error" en vez
+        de hacer fallar al resto.
+        
+        Args:
+            weeks: Plan mensual ({"semana_1": {"week_number", "planning_description"}, ...});
+                las claves que no empiezan por "semana_" se ignoran
+            resources_paths: Paths de recursos ya validados
+            brand_context: Contexto opcional de marca
+            brand_colors: Colores de marca para preseleccionar recursos
+            max_resources: Máximo de recursos preseleccionados por semana
+            max_concurrent_weeks: Semanas en curso a la vez (PLANNER_MAX_CONCURRENT_WEEKS por defecto)
+            week_timeout: Segundos máximos por semana (PLANNER_WEEK_TIMEOUT_SECONDS por defecto)
+            on_week: Corrutina opcional que recibe cada semana en cuanto termina
+            cache: Modo de la caché de respuestas ("reuse", "refresh" o "bypass")
+            
+        Returns:
+            {semana: {"week_number", "planning_description", "daily_posts" o "error"}}
+            en orden de semana
+        """
+        limit = asyncio.Semaphore(max_concurrent_weeks or PLANNER_MAX_CONCURRENT_WEEKS)
+        timeout = week_timeout or PLANNER_WEEK_TIMEOUT_SECONDS
+        
+        async def generate_week(week_key: str, week_data: Dict[str, Any]) -> Dict[str, Any]:
+            week = {
+                "week_number": week_data.get("week_number"),
+                "planning_description": week_data.get("planning_description", "")
+            }
+            try:
+                async with limit:
+                    print(f"   Procesando {week_key}...")
+                    week_resources = await asyncio.to_thread(
+                        self.select_resources,
+                        week["planning_description"],
+                        resources_paths,
+                        brand_colors,
+                        max_resources
+                    )
+                    week["daily_posts"] = await asyncio.wait_for(
+                        self.generate_weekly_plan_async(
+                            high_level_planning=week["planning_description"],
+                            resources_paths=week_resources,
+                            brand_context=brand_context,
+                            cache=cache
+                        ),
+                        timeout=timeout
+                    )
+            except asyncio.TimeoutError:
+                week["error"] = f"La semana superó el tiempo máximo de {timeout:g}s"
+            except Exception as e:
+                week["error"] = str(e)
+            if "error" in week:
+                print(f"❌ {week_key}: {week['error']}")
+            if on_week:
+                await on_week({"week_key": week_key, **week})
+            return week
+        
+        def week_order(week_key: str) -> tuple:
+            number = weeks[week_key].get("week_number")
+            suffix = week_key[len("semana_"):]
+            if not isinstance(number, int):
+                number = int(suffix) if suffix.isdigit() else 0
+            return (number, week_key)
+        
+        week_keys = sorted((key for key in weeks if key.startswith("semana_")), key=week_order)
+        results = await asyncio.gather(*[generate_week(key, weeks[key]) for key in week_keys])
+        return dict(zip(week_keys, results))
+    
+    def _build_request(
+        self,
+        high_level_planning: str,
+        resources_paths: List[str],
+        brand_context: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Parámetros de la llamada a chat.completions del weekly planner.
+        """
+        
+        # Construir el prompt para el agente de OpenAI
+        prompt = self._build_prompt(high_level_planning, resources_paths, brand_context)
+        
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Eres un community manager experto especializado en crear planificaciones semanales para redes sociales. Debes generar respuestas en formato JSON válido siguiendo exactamente la estructura solicitada."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.7,
+            max_tokens=2000,
+            response_format={"type": "json_object"}
+        )
+    
     def _build_prompt(
         self,
         high_level_planning: str,
@@ -254,24 +379,56 @@ IMPORTANTE:
         
         return prompt
 
-    def validate_resources(self, resources_paths: List[str]) -> List[str]:
+    def select_resources(
+        self,
+        high_level_planning: str,
+        resources_paths: List[str],
+        brand_colors: Optional[List[str]] = None,
+        max_resources: Optional[int] = None
+    ) -> List[str]:
         """
-        Valida que los recursos (imágenes) existan en el sistema.
+        Preselecciona localmente los recursos más afines a la planificación,
+        para que el prompt no crezca con el tamaño del catálogo.
         
         Args:
-            resources_paths: Lista de paths a validar
+            high_level_planning: Descripción de la semana (o del día) usada como consulta
+            resources_paths: Paths candidatos (ya validados)
+            brand_colors: Colores de marca opcionales (#rrggbb o nombres)
+            max_resources: Máximo de recursos a pasar al planner; None usa
+                PLANNER_RESOURCE_CANDIDATES y 0 desactiva la preselección
             
         Returns:
-            Lista de paths válidos
+            Como mucho `max_resources` paths, del más al menos afín
         """
-        valid_resources = []
-        for path in resources_paths:
-            if os.path.exists(path):
-                valid_resources.append(path)
-            else:
-                print(f"Advertencia: El recurso {path} no existe")
+        search = get_resource_search()
+        k = search.default_k if max_resources is None else max_resources
+        if k <= 0 or len(resources_paths) <= k:
+            return resources_paths
         
-        return valid_resources
+        results = search.search(
+            query=high_level_planning,
+            colors=brand_colors,
+            k=k,
+            candidates=resources_paths
+        )
+        return [result["path"] for result in results]
+
+    def validate_resources(self, resources_paths: List[str]) -> ResourceValidation:
+        """
+        Valida en bloque los recursos (imágenes) contra el catálogo de
+        resources_content, aceptando nombres cortos como "avatars/x.webp".
+        
+        Args:
+            resources_paths: Lista de paths a validar
+            
+        Returns:
+            ResourceValidation con los paths válidos (ya resueltos), los
+            inválidos y sugerencias para cada inválido
+        """
+        validation = get_resource_catalog().validate(resources_paths)
+        if validation.invalid:
+            print(f"Advertencia: {len(validation.invalid)} recursos no existen: {', '.join(validation.invalid)}")
+        return validation
 
 def get_weekly_planner_service() -> WeeklyPlannerService:
     """
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+
+# Every store the services open goes to a scratch directory, never to the
+# real images_generated/ or data/
+_scratch = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+for name, relative in {
+    "IMAGE_PREVIEWS_DIR": "_partials",
+    "IMAGE_DERIVATIVES_DIR": "_derivatives",
+    "IMAGE_DERIVATIVES_DB": "data/image_derivatives.sqlite3",
+    "GENERATION_CACHE_DIR": "_cache",
+    "GENERATION_CACHE_DB": "data/generation_cache.sqlite3",
+    "IMAGE_VARIANTS_DIR": "_variants",
+    "IMAGE_VARIANTS_DB": "data/image_variants.sqlite3",
+    "REFERENCE_NORMALIZED_DIR": "_references",
+    "REFERENCE_NORMALIZED_DB": "data/normalized_references.sqlite3",
+    "IMAGE_JOBS_DB": "data/image_jobs.sqlite3",
+    "RESOURCE_INDEX_DB": "data/resource_index.sqlite3",
+    "LLM_CACHE_DB": "data/llm_cache.sqlite3",
+}.items():
+    os.environ[name] = os.path.join(_scratch, relative)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _shutdown_workers():
+    yield
+    from utils.workers import shutdown_process_pool
+    shutdown_process_pool()
+
+
+@pytest.fixture
+def fake_image_server():
+    from tests.fake_image_server import FakeImageServer
+    server = FakeImageServer().start()
+    yield server
+    server.stop()
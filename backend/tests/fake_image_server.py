@@ -0,0 +1,148 @@
+import base64
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Colors of the frames a stream sends: partials first, the final image last
+FRAME_COLORS = [(40, 40, 40), (120, 120, 120), (200, 200, 200), (30, 90, 250)]
+
+
+def frame_base64(color: Tuple[int, int, int], output_format: str = "png") -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), color).save(buffer, format="JPEG" if output_format == "jpeg" else output_format.upper())
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class FakeImageServer:
+    """
+    Local stand-in for the gpt-image-1 images API, for tests.
+
+    POST /v1/images/generations and /v1/images/edits answer with a
+    Server-Sent Events stream when the request asks for `stream`: one
+    `image_generation.partial_image` event per requested partial frame,
+    `frame_delay` seconds apart, then `image_generation.completed`. Other
+    requests get a regular JSON response with one image. Point an
+    AsyncOpenAI client at `base_url`.
+    """
+
+    def __init__(self, frame_delay: float = 0.0):
+        self.frame_delay = frame_delay
+        self.requests: List[Dict[str, Any]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeImageServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("content-length", 0)))
+                params = _parse_params(self.headers.get("content-type", ""), body)
+                fake.requests.append({"path": self.path, **params})
+                if self.path not in ("/v1/images/generations", "/v1/images/edits"):
+                    self.send_error(404)
+                    return
+                if params.get("stream"):
+                    fake._stream(self, params)
+                else:
+                    fake._respond(self, params)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _respond(self, handler: BaseHTTPRequestHandler, params: Dict[str, Any]) -> None:
+        output_format = params.get("output_format", "png")
+        payload = json.dumps({
+            "created": int(time.time()),
+            "data": [{"b64_json": frame_base64(FRAME_COLORS[-1], output_format)}],
+        }).encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("content-type", "application/json")
+        handler.send_header("content-length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def _stream(self, handler: BaseHTTPRequestHandler, params: Dict[str, Any]) -> None:
+        output_format = params.get("output_format", "png")
+        common = {
+            "background": "opaque",
+            "created_at": int(time.time()),
+            "output_format": output_format,
+            "quality": params.get("quality", "medium"),
+            "size": params.get("size", "1024x1024"),
+        }
+        handler.send_response(200)
+        handler.send_header("content-type", "text/event-stream")
+        handler.send_header("connection", "close")
+        handler.end_headers()
+
+        partial_images = int(params.get("partial_images") or 0)
+        for index in range(partial_images):
+            _send_event(handler, {
+                **common,
+                "type": "image_generation.partial_image",
+                "partial_image_index": index,
+                "b64_json": frame_base64(FRAME_COLORS[index], output_format),
+            })
+            time.sleep(self.frame_delay)
+        _send_event(handler, {
+            **common,
+            "type": "image_generation.completed",
+            "b64_json": frame_base64(FRAME_COLORS[-1], output_format),
+            "usage": {
+                "input_tokens": 10,
+                "input_tokens_details": {"image_tokens": 0, "text_tokens": 10},
+                "output_tokens": 100,
+                "total_tokens": 110,
+            },
+        })
+        handler.close_connection = True
+
+
+def _send_event(handler: BaseHTTPRequestHandler, event: Dict[str, Any]) -> None:
+    handler.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+    handler.wfile.flush()
+
+
+def _parse_params(content_type: str, body: bytes) -> Dict[str, Any]:
+    """
+    Request parameters of a JSON (generations) or multipart (edits) body;
+    file parts are ignored.
+    """
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+
+    params: Dict[str, Any] = {}
+    boundary = content_type.partition("boundary=")[2].strip('"').encode("utf-8")
+    for part in body.split(b"--" + boundary):
+        headers, _, value = part.partition(b"\r\n\r\n")
+        if b"filename=" in headers or b'name="' not in headers:
+            continue
+        name = headers.split(b'name="', 1)[1].split(b'"', 1)[0].decode("utf-8")
+        params[name] = value.rstrip(b"\r\n").decode("utf-8", "replace")
+    if params.get("stream") in ("true", "True"):
+        params["stream"] = True
+    return params
@@ -0,0 +1,150 @@
+import asyncio
+import os
+
+import httpx
+from fastapi import FastAPI
+from openai import AsyncOpenAI
+
+from routes.images import router
+from services.image_generator import ImageGeneratorService
+from services.image_previews import ImagePreviewBroker, get_image_preview_broker
+from services.upstream_scheduler import UpstreamScheduler
+from tests.fake_image_server import FRAME_COLORS, frame_base64
+
+
+def streaming_service(server) -> ImageGeneratorService:
+    service = ImageGeneratorService()
+    service.async_client = AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+    # Fresh scheduler per test: asyncio primitives can't move between event loops
+    service.scheduler = UpstreamScheduler(name="test")
+    return service
+
+
+def test_streaming_call_yields_partials_then_completed(fake_image_server):
+    service = streaming_service(fake_image_server)
+    partials = []
+
+    async def on_partial(partial_index: int, image_base64: str) -> None:
+        partials.append((partial_index, image_base64))
+
+    completed = asyncio.run(service.generate_image_streaming(
+        prompt="A lighthouse at dusk",
+        quality="high",
+        size="1536x1024",
+        output_format="png",
+        partial_images=2,
+        on_partial=on_partial,
+    ))
+
+    assert [index for index, _ in partials] == [0, 1]
+    assert partials[0][1] == frame_base64(FRAME_COLORS[0])
+    assert completed.b64_json == frame_base64(FRAME_COLORS[-1])
+    assert fake_image_server.requests[0]["stream"] is True
+    assert fake_image_server.requests[0]["partial_images"] == 2
+
+
+def test_partial_frames_are_replaced_by_the_final_image(fake_image_server, tmp_path):
+    fake_image_server.frame_delay = 0.05
+    service = streaming_service(fake_image_server)
+    broker = service.preview_broker
+
+    async def run():
+        # Subscribed before the first frame exists, as a client would
+        events = []
+
+        async def watch() -> None:
+            async for event in broker.subscribe("previewtest.0", timeout=10):
+                events.append(event)
+
+        watcher = asyncio.create_task(watch())
+        await asyncio.sleep(0)
+        result = await service.generate_multiple_images_parallel(
+            prompt="A lighthouse at dusk",
+            count=1,
+            output_format="png",
+            save_directory=str(tmp_path),
+            filename_prefix="lighthouse",
+            partial_images=3,
+            preview_key="previewtest",
+        )
+        await asyncio.wait_for(watcher, 10)
+        await asyncio.gather(*service.derivatives._background, return_exceptions=True)
+        return result, events
+
+    result, events = asyncio.run(run())
+
+    image = result["successful"][0]
+    assert image["preview_id"] == "previewtest.0"
+    assert os.path.exists(image["image_path"])
+
+    assert [event["event"] for event in events] == ["partial", "partial", "partial", "completed"]
+    assert [event["partial_index"] for event in events[:3]] == [0, 1, 2]
+    assert events[-1]["path"] == image["image_path"]
+    # Frames were on disk while streaming and are gone once the image is final
+    for event in events[:3]:
+        assert not os.path.exists(event["path"])
+    assert broker.get("previewtest.0") == {
+        "image_id": "previewtest.0",
+        "done": True,
+        "events": [events[-1]],
+    }
+
+
+def test_image_ids_never_leave_the_previews_directory(tmp_path):
+    broker = ImagePreviewBroker(root=str(tmp_path / "previews"), max_images=10)
+    outside = tmp_path / "victim.0"
+    outside.mkdir()
+    (outside / "keep").write_text("x")
+
+    async def run():
+        frame = await broker.add_partial(str(tmp_path / "evil.0"), 0, frame_base64(FRAME_COLORS[0]), "png")
+        await broker.complete(str(outside), None)
+        await broker.complete("../victim.0", None)
+        return frame
+
+    frame = asyncio.run(run())
+
+    assert os.path.commonpath([frame, str(tmp_path / "previews")]) == str(tmp_path / "previews")
+    assert not (tmp_path / "evil.0").exists()
+    assert (outside / "keep").exists()
+
+
+def test_events_carry_public_urls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broker = ImagePreviewBroker(root="images_generated/_partials", max_images=10)
+
+    async def run():
+        await broker.add_partial("urltest.0", 0, frame_base64(FRAME_COLORS[0]), "png")
+        await broker.complete("urltest.0", "images_generated/batch/final.png")
+        await broker.add_partial("urltest.1", 0, frame_base64(FRAME_COLORS[0]), "png")
+        return broker.get("urltest.1")["events"][0], broker.get("urltest.0")["events"][0]
+
+    partial, completed = asyncio.run(run())
+
+    assert partial["url"] == "/static/_partials/" + os.path.relpath(partial["path"], "images_generated/_partials")
+    assert completed["url"] == "/static/batch/final.png"
+
+
+def test_bad_preview_key_is_rejected():
+    app = FastAPI()
+    app.include_router(router)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batch = await client.post("/images/generate-batch", json={
+                "prompt": "p", "count": 1, "partial_images": 2, "preview_key": "../../tmp/evil",
+            })
+            weekly = await client.post("/images/generate-weekly-plan", json={
+                "weekly_plan_json": {"success": True, "weekly_plan": {"lunes": {"description": "d"}}},
+                "partial_images": 2,
+                "preview_key": "/tmp/evil",
+            })
+            return batch, weekly
+
+    batch, weekly = asyncio.run(run())
+
+    assert batch.status_code == 400
+    assert weekly.status_code == 400
+    assert "preview_key" in batch.json()["detail"]
+    assert get_image_preview_broker().get("../../tmp/evil.0") is None
@@ -1,17 +1,103 @@
 from datetime import datetime
+import asyncio
+import os
 import uuid
 from pathlib import Path
 import base64
+from typing import Optional
 from PIL import Image
 from io import BytesIO
+from utils.workers import run_in_process
 
-def save_image(result, image_path):
-    # Save the image to a file
-    image_base64 = result.data[0].b64_json
-    image_bytes = base64.b64decode(image_base64)
+# Pillow format names for the output formats the images API accepts
+PIL_FORMATS = {"jpeg": "JPEG", "jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+def normalize_format(output_format: str) -> str:
+    output_format = output_format.lower().lstrip(".")
+    return "jpeg" if output_format == "jpg" else output_format
 
+def detect_image_format(image_bytes: bytes) -> Optional[str]:
+    """
+    Identify jpeg/png/webp payloads from their magic bytes.
+    """
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def transcode_image(image_bytes: bytes, output_format: str) -> bytes:
+    """
+    Re-encode an image into `output_format`. CPU-bound: meant for the
+    process pool.
+    """
+    output_format = normalize_format(output_format)
     image = Image.open(BytesIO(image_bytes))
-    image.save(image_path, format="JPEG", quality=95, optimize=True)
+    if output_format == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = BytesIO()
+    if output_format == "jpeg":
+        image.save(buffer, format="JPEG", quality=95, optimize=True)
+    else:
+        image.save(buffer, format=PIL_FORMATS[output_format])
+    return buffer.getvalue()
+
+def write_image_bytes(image_bytes: bytes, image_path: str) -> None:
+    """
+    Write the file atomically so readers never see a partial image.
+    """
+    tmp_path = f"{image_path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, image_path)
+
+def _target_format(image_path: str, output_format: Optional[str]) -> str:
+    return normalize_format(output_format or Path(image_path).suffix or "jpeg")
+
+def save_image(result, image_path, output_format: Optional[str] = None):
+    # Save the first image of an images API response to a file
+    save_image_data(result.data[0], image_path, output_format)
+
+def save_image_data(image_data, image_path, output_format: Optional[str] = None):
+    # Save a single image item (one entry of `result.data`) to a file.
+    # The decoded bytes are written as-is when they already are in the
+    # requested format; only real format changes are re-encoded.
+    image_bytes = base64.b64decode(image_data.b64_json)
+    target_format = _target_format(image_path, output_format)
+
+    if detect_image_format(image_bytes) != target_format:
+        image_bytes = transcode_image(image_bytes, target_format)
+
+    write_image_bytes(image_bytes, image_path)
+
+def _decode_and_write(image_base64: str, image_path: str, target_format: str) -> bool:
+    """
+    Decode and write the payload if it needs no transcode.
+    Returns False (and writes nothing) when the format differs.
+    """
+    image_bytes = base64.b64decode(image_base64)
+    if detect_image_format(image_bytes) != target_format:
+        return False
+    write_image_bytes(image_bytes, image_path)
+    return True
+
+def _decode_transcode_and_write(image_base64: str, image_path: str, target_format: str) -> None:
+    image_bytes = transcode_image(base64.b64decode(image_base64), target_format)
+    write_image_bytes(image_bytes, image_path)
+
+async def save_image_data_async(image_data, image_path, output_format: Optional[str] = None):
+    """
+    Persist a single image item without blocking the event loop: matching
+    formats are written straight to disk from a worker thread, transcodes
+    go to the bounded process pool.
+    """
+    target_format = _target_format(image_path, output_format)
+    written = await asyncio.to_thread(_decode_and_write, image_data.b64_json, image_path, target_format)
+    if not written:
+        await run_in_process(_decode_transcode_and_write, image_data.b64_json, image_path, target_format)
 
 def generate_image_path(
         save_directory: str,
@@ -30,4 +116,4 @@ def generate_image_path(
         unique_id = str(uuid.uuid4())[:8]
         filename = f"{filename_prefix}_{index}_{timestamp}_{unique_id}.{output_format.lower()}"
         
-        return str(Path(save_directory) / filename)
\ No newline at end of file
+        return str(Path(save_directory) / filename)
@@ -1,112 +1,304 @@
+import difflib
 import os
+import threading
+import time
+from collections import defaultdict
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional
+
+RESOURCES_ROOT = "resources_content"
+RESOURCE_CATEGORIES = ("templates", "elements", "avatars", "images")
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
+
+
+class _CategoryListing:
+    def __init__(self, dir_mtime_ns: Optional[int], files: List[str]):
+        self.dir_mtime_ns = dir_mtime_ns
+        self.files = files
+        self.members = set(files)
+        self.names = {Path(path).name: path for path in files}
+
+
+class ResourceValidation(NamedTuple):
+    # Resolved catalog paths, deduplicated, in request order
+    valid: List[str]
+    # Requested paths that don't name a resource (or point outside resources_content)
+    invalid: List[str]
+    # Requested path -> resolved path, for every valid entry
+    resolved: Dict[str, str]
+    # Invalid path -> closest existing resources
+    suggestions: Dict[str, List[str]]
+
+
+class ResourceCatalog:
+    """
+    In-memory listing of the image files under resources_content/<category>.
+
+    Each category directory is scanned once and rescanned only when its
+    mtime changes (adding, removing or renaming a file bumps it). The
+    mtime itself is checked at most every `check_interval` seconds, so a
+    listing request normally costs no syscalls at all. Per-file stats are
+    taken lazily and cached until the next rescan.
+    """
+
+    def __init__(self, root: str = RESOURCES_ROOT, check_interval: float = 2.0):
+        self.root = Path(root)
+        self.check_interval = check_interval
+        self._listings: Dict[str, _CategoryListing] = {}
+        self._stats: Dict[str, os.stat_result] = {}
+        self._last_check = 0.0
+        self._scans = 0
+        self._lock = threading.Lock()
+
+    def _dir_mtime_ns(self, category: str) -> Optional[int]:
+        try:
+            return os.stat(self.root / category).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _scan(self, category: str, dir_mtime_ns: Optional[int]) -> None:
+        files = []
+        if dir_mtime_ns is not None:
+            with os.scandir(self.root / category) as entries:
+                for entry in entries:
+                    # DirEntry.is_file() uses the type from the directory listing, no stat
+                    if entry.is_file() and Path(entry.name).suffix.lower() in IMAGE_EXTENSIONS:
+                        files.append(str(self.root / category / entry.name))
+        files.sort()
+
+        previous = self._listings.get(category)
+        if previous is not None:
+            for path in previous.files:
+                self._stats.pop(path, None)
+        self._listings[category] = _CategoryListing(dir_mtime_ns, files)
+        self._scans += 1
+
+    def _check(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        for category in RESOURCE_CATEGORIES:
+            dir_mtime_ns = self._dir_mtime_ns(category)
+            listing = self._listings.get(category)
+            if force or listing is None or listing.dir_mtime_ns != dir_mtime_ns:
+                self._scan(category, dir_mtime_ns)
+
+    def refresh(self) -> Dict[str, int]:
+        """
+        Rescan every category now, regardless of mtimes.
+
+        Returns:
+            Number of files per category
+        """
+        with self._lock:
+            self._check(force=True)
+            return {category: len(listing.files) for category, listing in self._listings.items()}
+
+    def invalidate(self) -> None:
+        """
+        Make the next read check directory mtimes right away (after this
+        process added or removed files itself).
+        """
+        with self._lock:
+            self._last_check = 0.0
+
+    def get(self, category: str) -> List[str]:
+        """
+        Paths of the image files in one category.
+
+        Raises:
+            ValueError: If `category` is not one of RESOURCE_CATEGORIES
+        """
+        if category not in RESOURCE_CATEGORIES:
+            raise ValueError(f"Unknown resource category: {category}")
+        with self._lock:
+            self._check()
+            return list(self._listings[category].files)
+
+    def get_all(self) -> Dict[str, List[str]]:
+        with self._lock:
+            self._check()
+            return {category: list(self._listings[category].files) for category in RESOURCE_CATEGORIES}
+
+    def stat(self, path: str) -> Optional[os.stat_result]:
+        """
+        Stat a catalog file, cached until its category is rescanned.
+        Returns None if the file is not in the catalog or has disappeared.
+        """
+        with self._lock:
+            self._check()
+            cached = self._stats.get(path)
+            if cached is not None:
+                return cached
+            if not any(path in listing.members for listing in self._listings.values()):
+                return None
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._stats[path] = stat_result
+        return stat_result
+
+    def _within_root(self, path: str) -> Optional[str]:
+        """
+        `path` as a normalized path under the root ("avatars/x.webp" and
+        "resources_content/avatars/x.webp" both give the latter), or None
+        if it points outside it.
+        """
+        path = path.strip().replace("\\", "/")
+        if not path:
+            return None
+        if os.path.isabs(path):
+            parts = Path(os.path.relpath(path, self.root)).parts
+        else:
+            parts = Path(os.path.normpath(path)).parts
+            if parts and parts[0] == self.root.name:
+                parts = parts[1:]
+        if not parts or parts[0] == "..":
+            return None
+        return str(self.root.joinpath(*parts))
+
+    def validate(self, paths: List[str], max_suggestions: int = 3) -> ResourceValidation:
+        """
+        Resolve a batch of resource paths in one pass over the catalog.
+
+        Accepts "resources_content/avatars/x.webp", "avatars/x.webp", a bare
+        file name when exactly one category has it, and absolute paths inside
+        resources_content. Anything that resolves outside resources_content is
+        invalid. Invalid entries get up to `max_suggestions` close matches.
+        """
+        with self._lock:
+            self._check()
+            members = set().union(*(listing.members for listing in self._listings.values()))
+            by_name = defaultdict(list)
+            for category in RESOURCE_CATEGORIES:
+                for name, path in self._listings[category].names.items():
+                    by_name[name].append(path)
+
+        root = os.path.realpath(self.root)
+        valid, invalid, resolved, suggestions = [], [], {}, {}
+        valid_set = set()
+        for requested in paths:
+            candidate = self._within_root(requested)
+            match = None
+            if candidate in members:
+                match = candidate
+            elif (
+                candidate is not None
+                and Path(candidate).parent == self.root
+                and len(by_name.get(Path(candidate).name, [])) == 1
+            ):
+                # Bare file name that only one category has
+                match = by_name[Path(candidate).name][0]
+            elif (
+                candidate is not None
+                and Path(candidate).suffix.lower() in IMAGE_EXTENSIONS
+                and os.path.realpath(candidate).startswith(root + os.sep)
+                and os.path.isfile(candidate)
+            ):
+                # Files outside the category folders aren't listed but are still resources
+                match = candidate
+
+            if match is None:
+                invalid.append(requested)
+                name = Path(requested.replace("\\", "/")).name
+                close = by_name.get(name) or [
+                    path
+                    for close_name in difflib.get_close_matches(name, by_name, n=max_suggestions)
+                    for path in by_name[close_name]
+                ]
+                suggestions[requested] = close[:max_suggestions]
+                continue
+
+            if match not in valid_set:
+                valid.append(match)
+                valid_set.add(match)
+            resolved[requested] = match
+
+        return ResourceValidation(valid, invalid, resolved, suggestions)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "files": {category: len(listing.files) for category, listing in self._listings.items()},
+                "scans": self._scans,
+                "stat_cache_entries": len(self._stats),
+                "check_interval": self.check_interval,
+            }
+
+
+_resource_catalog: Optional[ResourceCatalog] = None
+
+def get_resource_catalog() -> ResourceCatalog:
+    """
+    Process-wide resource catalog; RESOURCE_CATALOG_CHECK_SECONDS sets how
+    often directory mtimes are checked.
+    """
+    global _resource_catalog
+    if _resource_catalog is None:
+        _resource_catalog = ResourceCatalog(
+            check_interval=float(os.getenv("RESOURCE_CATALOG_CHECK_SECONDS", "2")),
+        )
+    return _resource_catalog
 
 def get_templates() -> List[str]:
     """
     Retrieve all template image files from resources_content/templates directory.
-    
+
     Returns:
         List of file paths to template images
     """
-    templates_dir = Path("resources_content/templates")
-    if not templates_dir.exists():
-        return []
-    
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
-    template_files = []
-    
-    for file_path in templates_dir.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            template_files.append(str(file_path))
-    
-    return sorted(template_files)
+    return get_resource_catalog().get("templates")
 
 def get_elements() -> List[str]:
     """
     Retrieve all element image files from resources_content/elements directory.
-    
+
     Returns:
         List of file paths to element images
     """
-    elements_dir = Path("resources_content/elements")
-    if not elements_dir.exists():
-        return []
-    
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
-    element_files = []
-    
-    for file_path in elements_dir.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            element_files.append(str(file_path))
-    
-    return sorted(element_files)
+    return get_resource_catalog().get("elements")
 
 def get_avatars() -> List[str]:
     """
     Retrieve all avatar image files from resources_content/avatars directory.
-    
+
     Returns:
         List of file paths to avatar images
     """
-    avatars_dir = Path("resources_content/avatars")
-    if not avatars_dir.exists():
-        return []
-    
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
-    avatar_files = []
-    
-    for file_path in avatars_dir.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            avatar_files.append(str(file_path))
-    
-    return sorted(avatar_files)
+    return get_resource_catalog().get("avatars")
 
 def get_images() -> List[str]:
     """
     Retrieve all image files from resources_content/images directory.
-    
+
     Returns:
         List of file paths to images
     """
-    images_dir = Path("resources_content/images")
-    if not images_dir.exists():
-        return []
-    
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
-    image_files = []
-    
-    for file_path in images_dir.iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            image_files.append(str(file_path))
-    
-    return sorted(image_files)
+    return get_resource_catalog().get("images")
 
 def get_all_resources() -> Dict[str, List[str]]:
     """
     Retrieve all image files from all subdirectories in resources_content.
-    
+
     Returns:
         Dictionary with keys as directory names and values as lists of file paths
     """
-    return {
-        'templates': get_templates(),
-        'elements': get_elements(),
-        'avatars': get_avatars(),
-        'images': get_images()
-    }
+    return get_resource_catalog().get_all()
 
 def get_all_images() -> List[str]:
     """
     Retrieve all image files from the entire resources_content directory.
-    
+
     Returns:
         List of all image file paths from all subdirectories
     """
     all_images = []
     resources = get_all_resources()
-    
+
     for category, files in resources.items():
         all_images.extend(files)
-    
-    return sorted(all_images)
\ No newline at end of file
+
+    return sorted(all_images)
@@ -0,0 +1,197 @@
+import os
+import re
+import stat
+import threading
+from collections import OrderedDict
+from mimetypes import guess_type
+from typing import List, Tuple
+
+import anyio
+import xxhash
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Filenames produced by generate_image_path (..._YYYYMMDD_HHMMSS_<uuid8>.ext)
+# and their derivatives (....jpeg.thumb.webp) are never rewritten in place
+CONTENT_UNIQUE_NAME = re.compile(r"_\d{8}_\d{6}_[0-9a-f]{8}(\.[a-z]+){0,2}\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Precompressed siblings served when the client accepts them, in order of preference
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Never served even if present under a mount: SQLite databases (manifests
+# written there by older versions) and dotfiles such as in-progress uploads
+PRIVATE_NAME = re.compile(r"(^\.|\.sqlite3(-wal|-shm|-journal)?$)")
+
+
+def cache_control_for(path: str) -> str:
+    """
+    Long-lived immutable caching for content-unique filenames; anything
+    else (resources, partial preview frames) is revalidated with its ETag.
+    """
+    if CONTENT_UNIQUE_NAME.search(os.path.basename(path)):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def parse_accept_header(value: str) -> List[str]:
+    """
+    Lower-cased tokens of an Accept / Accept-Encoding header, skipping
+    those the client refuses with q=0.
+    """
+    tokens = []
+    for part in value.split(","):
+        token, *params = [p.strip() for p in part.split(";")]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, param_value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            tokens.append(token.lower())
+    return tokens
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles with cache-friendly headers:
+
+    - `Cache-Control: immutable` for content-unique filenames,
+      `no-cache` (ETag revalidation) for everything else
+    - strong ETags from an xxhash of the file contents, memoized per
+      path/mtime/size so each file is hashed once
+    - `.br` / `.gz` siblings served when the client accepts them
+    - optionally, images negotiated by `Accept` through `variants`
+      (an ImageVariantService), with `Vary: Accept`
+
+    Range and conditional requests are handled by Starlette's FileResponse.
+    """
+
+    def __init__(self, *args, max_etags: int = 10000, variants=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_etags = max_etags
+        self.variants = variants
+        self._etags: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._etags_lock = threading.Lock()
+
+    def etag(self, path: str, stat_result: os.stat_result) -> str:
+        with self._etags_lock:
+            cached = self._etags.get(path)
+            if cached is not None and cached[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+                self._etags.move_to_end(path)
+                return cached[2]
+
+        hasher = xxhash.xxh3_128()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        etag = f'"{hasher.hexdigest()}"'
+
+        with self._etags_lock:
+            self._etags[path] = (stat_result.st_mtime_ns, stat_result.st_size, etag)
+            self._etags.move_to_end(path)
+            while len(self._etags) > self.max_etags:
+                self._etags.popitem(last=False)
+        return etag
+
+    def _precompressed(self, full_path: str, stat_result: os.stat_result) -> List[Tuple[str, str, os.stat_result]]:
+        """
+        (encoding, path, stat) of compressed siblings at least as new as the file.
+        """
+        variants = []
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(variant_stat.st_mode) and variant_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                variants.append((encoding, full_path + suffix, variant_stat))
+        return variants
+
+    def asset_response(
+        self,
+        full_path: str,
+        stat_result: os.stat_result,
+        request_headers: Headers,
+        variant=None,
+    ) -> Response:
+        """
+        Build the response for a regular file, or for the negotiated
+        `variant` of an image. Blocking (stats and hashing), so it runs in
+        a worker thread.
+        """
+        headers = {"cache-control": cache_control_for(full_path)}
+        vary = []
+        serve_path, serve_stat = full_path, stat_result
+
+        if variant is not None:
+            vary.append("Accept")
+            if variant.pending:
+                # The original stands in until the transcode is ready
+                headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+            if variant.path is not None:
+                try:
+                    serve_path, serve_stat = variant.path, os.stat(variant.path)
+                except FileNotFoundError:
+                    pass
+
+        variants = self._precompressed(full_path, stat_result) if serve_path == full_path else []
+        if variants:
+            vary.append("Accept-Encoding")
+            accepted = parse_accept_header(request_headers.get("accept-encoding", ""))
+            for encoding, variant_path, variant_stat in variants:
+                if encoding in accepted:
+                    headers["content-encoding"] = encoding
+                    serve_path, serve_stat = variant_path, variant_stat
+                    break
+
+        if vary:
+            headers["vary"] = ", ".join(vary)
+        headers["etag"] = self.etag(serve_path, serve_stat)
+        response = FileResponse(
+            serve_path,
+            stat_result=serve_stat,
+            headers=headers,
+            media_type=guess_type(full_path if "content-encoding" in headers else serve_path)[0] or "text/plain",
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if any(PRIVATE_NAME.search(part) for part in path.replace("\\", "/").split("/")):
+            raise HTTPException(status_code=404)
+        if scope["method"] in ("GET", "HEAD"):
+            try:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+            except OSError:
+                stat_result = None
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                request_headers = Headers(scope=scope)
+                variant = None
+                if self.variants is not None and self.variants.source_format(full_path):
+                    source_hash = await anyio.to_thread.run_sync(self.etag, full_path, stat_result)
+                    variant = await self.variants.negotiate(
+                        full_path,
+                        source_hash.strip('"'),
+                        stat_result.st_size,
+                        request_headers.get("accept", ""),
+                        QueryParams(scope["query_string"]).get("w"),
+                    )
+                return await anyio.to_thread.run_sync(
+                    self.asset_response, full_path, stat_result, request_headers, variant
+                )
+        # Directories, missing files and errors behave like plain StaticFiles
+        return await super().get_response(path, scope)
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from fastapi.responses import StreamingResponse
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+EventCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+def format_event(event: Dict[str, Any], stream_format: str) -> str:
+    """
+    Serialize one event as an NDJSON line or a Server-Sent Event.
+    """
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if stream_format == "sse":
+        return f"event: {event.get('event', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+def stream_events(
+    run: Callable[[EventCallback], Awaitable[Dict[str, Any]]],
+    stream_format: str = "ndjson",
+) -> StreamingResponse:
+    """
+    Run `run(on_event)` in the background and stream every event it emits
+    as soon as it happens, followed by a final "summary" event carrying the
+    coroutine's return value (or an "error" event if it raised).
+
+    Each event gets `elapsed_seconds` since the stream started. If the client
+    disconnects, the background work is cancelled.
+    """
+    if stream_format not in STREAM_MEDIA_TYPES:
+        raise ValueError(f"format must be one of {', '.join(STREAM_MEDIA_TYPES)}")
+
+    async def generator():
+        started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def on_event(event: Dict[str, Any]) -> None:
+            await queue.put({**event, "elapsed_seconds": round(time.monotonic() - started, 3)})
+
+        task = asyncio.create_task(run(on_event))
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield format_event(getter.result(), stream_format)
+                    continue
+
+                getter.cancel()
+                while not queue.empty():
+                    yield format_event(queue.get_nowait(), stream_format)
+                break
+
+            elapsed = round(time.monotonic() - started, 3)
+            if task.exception() is not None:
+                yield format_event({"event": "error", "error": str(task.exception()), "elapsed_seconds": elapsed}, stream_format)
+            else:
+                yield format_event({"event": "summary", **task.result(), "elapsed_seconds": elapsed}, stream_format)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        generator(),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
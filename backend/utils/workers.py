@@ -0,0 +1,32 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Bounded pool for CPU-bound image work (PIL encode/decode) so it never runs
+# on the event loop or competes with request handling for the GIL.
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+def get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        default_workers = min(4, os.cpu_count() or 1)
+        max_workers = int(os.getenv("IMAGE_PROCESS_WORKERS", str(default_workers)))
+        _process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    return _process_pool
+
+async def run_in_process(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a picklable, module-level function in the shared process pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), functools.partial(func, *args, **kwargs))
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None